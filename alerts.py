@@ -0,0 +1,56 @@
+from collections import namedtuple
+from config import ALERT_TEMP_DELTA, ALERT_PRESSURE_DROP
+
+# Наблюдение, с которым сравнивается следующее: температура, давление, вид осадков
+Observation = namedtuple('Observation', 'temp pressure precip')
+
+_PRECIP = {'Rain': 'rain', 'Drizzle': 'rain', 'Thunderstorm': 'rain', 'Snow': 'snow'}
+
+def default_alert_settings():
+    return {'temp': ALERT_TEMP_DELTA, 'pressure': ALERT_PRESSURE_DROP, 'precip': True}
+
+def settings_key(settings):
+    # Подписчики с одинаковыми порогами проверяются вместе
+    return tuple(sorted(settings.items()))
+
+def observe(data):
+    condition = data['weather'][0].get('main', '') if data.get('weather') else ''
+    return Observation(data['main']['temp'], data['main']['pressure'], _PRECIP.get(condition))
+
+def detect_changes(previous, current, settings):
+    # Возвращает список изменений [(вид, величина)], превысивших пороги
+    changes = []
+    delta = current.temp - previous.temp
+    if settings.get('temp') and abs(delta) >= settings['temp']:
+        changes.append(('temp', delta))
+    if settings.get('precip') and current.precip and current.precip != previous.precip:
+        changes.append((current.precip, None))
+    drop = previous.pressure - current.pressure
+    if settings.get('pressure') and drop >= settings['pressure']:
+        changes.append(('pressure', drop))
+    return changes
+
+def next_baseline(previous, current):
+    # Без оповещения температура сравнивается с последним отправленным наблюдением,
+    # давление - с максимумом после него, осадки - с последней проверкой
+    return Observation(previous.temp, max(previous.pressure, current.pressure), current.precip)
+
+def parse_alert_settings(args):
+    # "/alerts" - пороги по умолчанию, "/alerts off" - выключить,
+    # "/alerts temp=2 pressure=4 precip=off" - свои пороги; None означает выключение
+    if list(args) == ['off']:
+        return None
+    settings = default_alert_settings()
+    for arg in args:
+        name, sep, value = arg.partition('=')
+        if not sep or name not in settings:
+            raise ValueError(f"Неизвестный параметр оповещений: {arg}")
+        if name == 'precip':
+            if value not in ('on', 'off'):
+                raise ValueError(f"Ожидается precip=on или precip=off: {arg}")
+            settings[name] = value == 'on'
+        else:
+            settings[name] = float(value)
+            if settings[name] < 0:
+                raise ValueError(f"Порог не может быть отрицательным: {arg}")
+    return settings
@@ -0,0 +1,159 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from config import STATE_BACKEND, STATE_DB_FILE, LEADER_LEASE_TTL
+
+logger = logging.getLogger(__name__)
+
+class LocalBackend:
+    # Состояние принадлежит одному процессу, он всегда лидер
+    shared = False
+
+    def __init__(self):
+        self._usage = {}
+        self._usage_expiry = {}
+
+    @property
+    def worker_id(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def try_acquire_leadership(self, name, ttl=LEADER_LEASE_TTL):
+        return True
+
+    def release_leadership(self, name):
+        pass
+
+    def consume_usage(self, counters):
+        # counters: [(ключ окна, лимит, истекает в)]; вызов засчитывается во все окна
+        # только если ни одно из них не исчерпано
+        now = time.time()
+        for key, expires_at in list(self._usage_expiry.items()):
+            if expires_at <= now:
+                del self._usage_expiry[key]
+                self._usage.pop(key, None)
+        if any(self._usage.get(key, 0) >= limit for key, limit, _ in counters):
+            return False
+        for key, _, expires_at in counters:
+            self._usage[key] = self._usage.get(key, 0) + 1
+            self._usage_expiry[key] = expires_at
+        return True
+
+    def get_usage(self, keys):
+        return {key: self._usage.get(key, 0) for key in keys}
+
+class SQLiteBackend:
+    # Общее состояние для нескольких процессов: лидер выбирается через аренду
+    # в SQLite, блокировка файла базы гарантирует атомарность захвата
+    shared = True
+
+    def __init__(self, path=STATE_DB_FILE):
+        self.path = path
+        self._pid = None
+        self._worker_id = None
+        self._conn = None
+        self._lock = None
+
+    def _check_pid(self):
+        # Backend создаётся при импорте, до fork в workers.py: дочерний процесс
+        # получает свой идентификатор и не использует соединение родителя
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._worker_id = f"{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}"
+            self._conn = None
+            self._lock = threading.Lock()
+
+    @property
+    def worker_id(self):
+        self._check_pid()
+        return self._worker_id
+
+    def _locked(self):
+        self._check_pid()
+        return self._lock
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS usage (key TEXT PRIMARY KEY, used INTEGER NOT NULL, expires_at REAL NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def try_acquire_leadership(self, name, ttl=LEADER_LEASE_TTL):
+        now = time.time()
+        try:
+            with self._locked():
+                conn = self._connect()
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute(
+                        "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                        "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                        (name, self.worker_id, now + ttl, now),
+                    )
+                    row = conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Ошибка выбора лидера %s: %s", name, e)
+            return False
+        return row is not None and row[0] == self.worker_id
+
+    def release_leadership(self, name):
+        try:
+            with self._locked():
+                self._connect().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.worker_id))
+        except sqlite3.Error as e:
+            logger.error("Ошибка освобождения аренды %s: %s", name, e)
+
+    def consume_usage(self, counters):
+        # Проверка и увеличение счётчиков в одной транзакции: процессы делят общую квоту
+        now = time.time()
+        try:
+            with self._locked():
+                conn = self._connect()
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute("DELETE FROM usage WHERE expires_at <= ?", (now,))
+                    for key, limit, _ in counters:
+                        row = conn.execute("SELECT used FROM usage WHERE key = ?", (key,)).fetchone()
+                        if row is not None and row[0] >= limit:
+                            return False
+                    conn.executemany(
+                        "INSERT INTO usage (key, used, expires_at) VALUES (?, 1, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET used = used + 1",
+                        [(key, expires_at) for key, _, expires_at in counters],
+                    )
+        except sqlite3.Error as e:
+            # Учёт квоты не должен блокировать запросы при сбое базы состояния
+            logger.error("Ошибка учёта квоты: %s", e)
+            return True
+        return True
+
+    def get_usage(self, keys):
+        try:
+            with self._locked():
+                conn = self._connect()
+                rows = conn.execute(
+                    f"SELECT key, used FROM usage WHERE expires_at > ? AND key IN ({','.join('?' * len(keys))})",
+                    (time.time(), *keys),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Ошибка чтения квоты: %s", e)
+            rows = []
+        usage = dict.fromkeys(keys, 0)
+        usage.update(rows)
+        return usage
+
+def make_backend(kind=STATE_BACKEND):
+    if kind == 'local':
+        return LocalBackend()
+    if kind == 'sqlite':
+        return SQLiteBackend()
+    raise ValueError(f"Неизвестный STATE_BACKEND: {kind}")
+
+backend = make_backend()
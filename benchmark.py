@@ -0,0 +1,343 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import statistics
+from collections import Counter
+from types import SimpleNamespace
+from aiohttp import web
+
+# Нагрузочный тест без внешних сервисов: обработчики main получают синтетические
+# обновления, а Telegram Bot API, OpenWeatherMap и openexchangerates заменены
+# локальными серверами с настраиваемой задержкой и долей ошибок.
+
+logger = logging.getLogger('benchmark')
+
+BENCH_TOKEN = '123456:BENCH'
+
+class FakeUpstream:
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = Counter()
+
+    async def delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+def city_payload(city_id, name):
+    return {
+        'id': city_id,
+        'name': name,
+        'dt': int(time.time()) // 600 * 600,
+        'coord': {'lat': 50.45, 'lon': 30.52},
+        'weather': [{'id': 800, 'main': 'Clear', 'description': 'ясно'}],
+        'main': {'temp': 12.3, 'feels_like': 11.0, 'humidity': 60, 'pressure': 1012},
+        'wind': {'speed': 3.1},
+    }
+
+def make_owm_app(upstream):
+    async def weather(request):
+        upstream.calls['weather'] += 1
+        await upstream.delay()
+        if upstream.should_fail():
+            return web.json_response({'cod': 500}, status=500)
+        if 'id' in request.query:
+            city_id = int(request.query['id'])
+            return web.json_response(city_payload(city_id, f"city-{city_id}"))
+        if 'lat' in request.query:
+            city_id = abs(hash((request.query['lat'], request.query['lon']))) % 10_000_000
+            return web.json_response(city_payload(city_id, f"city-{city_id}"))
+        name = request.query.get('q', '')
+        if name.startswith('nowhere'):
+            return web.json_response({'cod': '404', 'message': 'city not found'}, status=404)
+        return web.json_response(city_payload(abs(hash(name)) % 10_000_000, name))
+
+    async def group(request):
+        upstream.calls['group'] += 1
+        await upstream.delay()
+        if upstream.should_fail():
+            return web.json_response({'cod': 500}, status=500)
+        ids = [int(city_id) for city_id in request.query['id'].split(',')]
+        return web.json_response({'cnt': len(ids), 'list': [city_payload(city_id, f"city-{city_id}") for city_id in ids]})
+
+    async def forecast(request):
+        upstream.calls['forecast'] += 1
+        await upstream.delay()
+        if upstream.should_fail():
+            return web.json_response({'cod': 500}, status=500)
+        city_id = int(request.query['id']) if 'id' in request.query else abs(hash(tuple(request.query.items()))) % 10_000_000
+        now = int(time.time()) // 10800 * 10800
+        items = [
+            {
+                'dt': now + i * 10800,
+                'main': {'temp': 10 + 5 * ((i % 8) - 4) / 4},
+                'weather': [{'id': 500, 'description': 'небольшой дождь' if i % 3 else 'облачно'}],
+                'pop': 0.4,
+                'rain': {'3h': 0.6} if i % 3 else {},
+            }
+            for i in range(40)
+        ]
+        return web.json_response({'city': {'id': city_id, 'name': f"city-{city_id}", 'timezone': 7200}, 'cnt': len(items), 'list': items})
+
+    app = web.Application()
+    app.router.add_get('/data/2.5/weather', weather)
+    app.router.add_get('/data/2.5/forecast', forecast)
+    app.router.add_get('/data/2.5/group', group)
+    return app
+
+def make_oxr_app(upstream):
+    async def latest(request):
+        upstream.calls['latest'] += 1
+        await upstream.delay()
+        if upstream.should_fail():
+            return web.json_response({'error': True}, status=500)
+        rates = {'UAH': 41.2, 'USD': 1.0, 'EUR': 0.92, 'GBP': 0.79, 'JPY': 151.0, 'RUB': 92.0}
+        return web.json_response({'timestamp': int(time.time()) // 3600 * 3600, 'rates': rates})
+
+    app = web.Application()
+    app.router.add_get('/api/latest.json', latest)
+    return app
+
+def make_telegram_app(upstream):
+    message_ids = iter(range(1, 10 ** 9))
+
+    async def method(request):
+        name = request.match_info['method']
+        upstream.calls[name] += 1
+        await upstream.delay()
+        params = dict(await request.post()) if request.can_read_body else {}
+        if not params and request.content_type == 'application/json':
+            params = await request.json()
+        if name == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+            return web.json_response({'ok': True, 'result': result})
+        if upstream.should_fail():
+            return web.json_response({'ok': False, 'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': 1}}, status=429)
+        chat_id = int(params.get('chat_id', 0))
+        result = {'message_id': next(message_ids), 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+        return web.json_response({'ok': True, 'result': result})
+
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', method)
+    return app
+
+async def start_server(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+def make_update(update_id, user_id, text):
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return {'update_id': update_id, 'message': message}
+
+def next_text(step, city):
+    # Сценарий пользователя: /start, «Погода», город, затем случайные кнопки
+    if step == 0:
+        return '/start'
+    if step == 1:
+        return 'Погода'
+    if step == 2:
+        return city
+    return random.choice(('Погода', 'Погода', 'Прогноз', 'Курс гривны'))
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+async def run_benchmark(args):
+    owm = FakeUpstream(args.owm_latency, args.owm_error_rate)
+    oxr = FakeUpstream(args.oxr_latency, args.oxr_error_rate)
+    telegram = FakeUpstream(args.telegram_latency, args.telegram_error_rate)
+    runners = []
+    for upstream, factory in ((owm, make_owm_app), (oxr, make_oxr_app), (telegram, make_telegram_app)):
+        runner, url = await start_server(factory(upstream))
+        runners.append(runner)
+        upstream.url = url
+
+    os.environ.update({
+        'TELEGRAM_TOKEN': BENCH_TOKEN,
+        'WEATHER_API_KEY': 'bench',
+        'CURRENCY_API_KEY': 'bench',
+        'OWM_API_URL': f"{owm.url}/data/2.5",
+        'OXR_API_URL': f"{oxr.url}/api",
+        'METRICS_PORT': '0',
+    })
+    # Синтетические пользователи пишут чаще живых; лимит входящих можно задать явно
+    os.environ.setdefault('INBOUND_RATE', '1000')
+    os.environ.setdefault('INBOUND_BURST', '1000')
+    import main
+    from telegram import Update
+    from scheduler import broadcasts
+    from message_utils import dispatcher
+    from metrics import inbound_rejected
+    logging.getLogger().setLevel(args.log_level)
+
+    application = main.build_application(token=BENCH_TOKEN, base_url=f"{telegram.url}/bot")
+    await application.initialize()
+    await application.post_init(application)
+
+    cities = [f"City{i}" for i in range(args.cities)]
+    steps = Counter()
+    latencies = {}
+    handler_errors = 0
+
+    async def process(update_id, user_id, text):
+        nonlocal handler_errors
+        update = Update.de_json(make_update(update_id, user_id, text), application.bot)
+        started = time.perf_counter()
+        try:
+            await application.process_update(update)
+        except Exception as e:
+            handler_errors += 1
+            logger.debug("Ошибка обработки обновления %s: %s", update_id, e)
+        kind = 'start' if text == '/start' else ('save_city' if text.startswith('City') else 'button')
+        latencies.setdefault(kind, []).append(time.perf_counter() - started)
+
+    tasks = []
+    started = time.perf_counter()
+    interval = 1 / args.rate
+    for update_id in range(1, args.updates + 1):
+        user_id = 100000 + random.randrange(args.users)
+        text = next_text(steps[user_id], cities[user_id % len(cities)])
+        steps[user_id] += 1
+        tasks.append(asyncio.create_task(process(update_id, user_id, text)))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    # Плановая рассылка по всем слотам
+    broadcast_started = time.perf_counter()
+    context = SimpleNamespace(bot=application.bot, job=SimpleNamespace(data=0))
+    for slot in range(broadcasts.slots):
+        context.job.data = slot
+        await broadcasts._run_slot(context)
+    broadcast_elapsed = time.perf_counter() - broadcast_started
+
+    await application.post_shutdown(application)
+    await application.shutdown()
+    for runner in runners:
+        await runner.cleanup()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'updates': args.updates,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(args.updates / elapsed, 2),
+        'p50_ms': round(percentile(all_latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(all_latencies, 0.99) * 1000, 2),
+        'handlers': {
+            kind: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 0.5) * 1000, 2),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+                'mean_ms': round(statistics.mean(values) * 1000, 2),
+            }
+            for kind, values in latencies.items()
+        },
+        'handler_errors': handler_errors,
+        'broadcast_s': round(broadcast_elapsed, 3),
+        'broadcast_subscribers': broadcasts.subscriber_count,
+        'outbound_retries': dispatcher.retry_count,
+        'inbound_rejected': {reason: inbound_rejected.value(reason) for reason in ('redelivered', 'rate', 'duplicate')},
+        'upstream_calls': {
+            'openweathermap': sum(owm.calls.values()),
+            'openexchangerates': sum(oxr.calls.values()),
+            'telegram_send': telegram.calls['sendMessage'],
+        },
+        'startup_ms': {step: round(seconds * 1000, 2) for step, seconds in main.startup_timings.items()},
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def report_value(report, path):
+    value = report
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def check_gates(report, gates):
+    # Формат порогов: {"max": {"p99_ms": 1500, "upstream_calls.openweathermap": 100}, "min": {"throughput_per_s": 100}}
+    failures = []
+    for bound, limits in gates.items():
+        for path, limit in limits.items():
+            value = report_value(report, path)
+            if value is None:
+                failures.append(f"{path}: метрика не найдена")
+            elif bound == 'max' and value > limit:
+                failures.append(f"{path}: {value} > {limit}")
+            elif bound == 'min' and value < limit:
+                failures.append(f"{path}: {value} < {limit}")
+    return failures
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с локальными заглушками внешних API")
+    parser.add_argument('--updates', type=int, default=2000, help="число синтетических обновлений")
+    parser.add_argument('--rate', type=float, default=200, help="обновлений в секунду")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--cities', type=int, default=50)
+    parser.add_argument('--owm-latency', type=float, default=0.05)
+    parser.add_argument('--owm-error-rate', type=float, default=0.0)
+    parser.add_argument('--oxr-latency', type=float, default=0.1)
+    parser.add_argument('--oxr-error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-latency', type=float, default=0.02)
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0)
+    parser.add_argument('--gates', help="JSON-файл с порогами, например {\"max\": {\"p99_ms\": 1500}, \"min\": {\"throughput_per_s\": 100}}")
+    parser.add_argument('--output', help="куда записать отчёт в JSON")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=args.log_level)
+
+    output = os.path.abspath(args.output) if args.output else None
+    gates = os.path.abspath(args.gates) if args.gates else None
+
+    # Отдельный рабочий каталог, чтобы не трогать данные пользователей и кэш
+    workdir = tempfile.mkdtemp(prefix='weather-bot-bench-')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+
+    report = asyncio.run(run_benchmark(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+    if gates:
+        with open(gates, 'r', encoding='utf-8') as file:
+            failures = check_gates(report, json.load(file))
+        for failure in failures:
+            print(f"РЕГРЕССИЯ: {failure}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
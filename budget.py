@@ -0,0 +1,90 @@
+import time
+import asyncio
+import logging
+import calendar
+from config import UPSTREAM_BUDGET_RESERVE, UPSTREAM_BUDGET_MAX_WAIT
+from backend import backend
+from metrics import upstream_budget_rejections
+
+logger = logging.getLogger(__name__)
+
+# Приоритет запроса к внешнему API: ответ пользователю или плановое/фоновое обновление
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BACKGROUND: 'background'}
+
+def window_period(window, now):
+    # Возвращает (метка текущего окна, время его окончания)
+    if window == 'minute':
+        period = int(now // 60)
+        return str(period), (period + 1) * 60
+    if window == 'month':
+        tm = time.gmtime(now)
+        year, month = (tm.tm_year + 1, 1) if tm.tm_mon == 12 else (tm.tm_year, tm.tm_mon + 1)
+        return f"{tm.tm_year}-{tm.tm_mon:02d}", calendar.timegm((year, month, 1, 0, 0, 0))
+    raise ValueError(f"Неизвестное окно квоты: {window}")
+
+class UpstreamBudget:
+    # Считает вызовы внешнего API по окнам (минута, месяц). Фоновые запросы
+    # останавливаются, когда остаётся reserve доли квоты, - остаток достаётся
+    # интерактивным. Счётчики хранятся в backend: при общем состоянии процессы
+    # расходуют одну квоту.
+    def __init__(self, name, limits, reserve=UPSTREAM_BUDGET_RESERVE, max_wait=UPSTREAM_BUDGET_MAX_WAIT, timer=time.time):
+        self.name = name
+        self.limits = {window: limit for window, limit in limits.items() if limit > 0}
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self._timer = timer
+        # Последние прочитанные остатки квоты для метрик, см. update_remaining
+        self._remaining = {}
+
+    def _counters(self, priority):
+        now = self._timer()
+        counters = []
+        for window, limit in self.limits.items():
+            period, expires_at = window_period(window, now)
+            if priority != PRIORITY_INTERACTIVE:
+                limit = int(limit * (1 - self.reserve))
+            counters.append((f"{self.name}:{window}:{period}", limit, expires_at))
+        return counters
+
+    async def _consume(self, priority):
+        counters = self._counters(priority)
+        if backend.shared:
+            return await asyncio.to_thread(backend.consume_usage, counters)
+        return backend.consume_usage(counters)
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE):
+        # True - вызов разрешён и уже учтён в квоте
+        if not self.limits:
+            return True
+        if await self._consume(priority):
+            return True
+        if priority == PRIORITY_INTERACTIVE and 'minute' in self.limits:
+            wait = window_period('minute', self._timer())[1] - self._timer()
+            if wait <= self.max_wait:
+                await asyncio.sleep(wait)
+                if await self._consume(priority):
+                    return True
+        upstream_budget_rejections.inc(self.name, _PRIORITY_NAMES[priority])
+        logger.warning("Квота %s исчерпана, %s запрос отклонён.", self.name, _PRIORITY_NAMES[priority])
+        return False
+
+    def remaining(self):
+        # {(внешний API, окно): оставшиеся вызовы} на момент последнего update_remaining
+        return self._remaining
+
+    async def update_remaining(self):
+        # Остатки читаются из backend; при общем состоянии это запрос к SQLite, он выполняется в потоке
+        if backend.shared:
+            self._remaining = await asyncio.to_thread(self._read_remaining)
+        else:
+            self._remaining = self._read_remaining()
+
+    def _read_remaining(self):
+        now = self._timer()
+        keys = {window: f"{self.name}:{window}:{window_period(window, now)[0]}" for window in self.limits}
+        if not keys:
+            return {}
+        usage = backend.get_usage(list(keys.values()))
+        return {(self.name, window): max(0, self.limits[window] - usage[key]) for window, key in keys.items()}
@@ -1,38 +1,57 @@
 import logging
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import CallbackContext
-from weather import get_weather_update, get_weather
+from weather import get_weather
 from currency import get_currency_rate
-from utils import request_city
-from user_data import load_user_data
+from forecast import get_forecast
+from utils import request_city, get_locale
+from user_data import load_user_data_async
 from message_utils import send_message_with_retries  # Добавлен импорт
+from render import message
+from metrics import timed_handler
 
 logger = logging.getLogger(__name__)
 
 async def show_menu(update, context):
-    buttons = [[KeyboardButton('Погода'), KeyboardButton('Курс гривны')]]
+    locale = get_locale(context)
+    buttons = [
+        [KeyboardButton(message('button_weather', locale)), KeyboardButton(message('button_forecast', locale))],
+        [KeyboardButton(message('button_currency', locale))],
+    ]
     keyboard = ReplyKeyboardMarkup(buttons, resize_keyboard=True)
     try:
         if update.message:
-            await update.message.reply_text('Выберите опцию:', reply_markup=keyboard)
+            await update.message.reply_text(message('choose_option', locale), reply_markup=keyboard)
         elif update.callback_query:
-            await update.callback_query.message.reply_text('Выберите опцию:', reply_markup=keyboard)
+            await update.callback_query.message.reply_text(message('choose_option', locale), reply_markup=keyboard)
     except Exception as e:
-        logger.error(f"Ошибка при показе меню: {e}")
+        logger.error("Ошибка при показе меню: %s", e)
 
+@timed_handler('button')
 async def button(update, context: CallbackContext):
     text = update.message.text
-    logger.info(f"Нажата кнопка: {text}")
+    locale = get_locale(context)
+    logger.debug("Нажата кнопка: %s", text)
     try:
-        if text == 'Погода':
-            user_data = load_user_data(update.effective_user.id)
-            if user_data and user_data['city']:
+        if text == message('button_weather', locale):
+            user_data = await load_user_data_async(update.effective_user.id)
+            if user_data and user_data.get('city'):
                 city = user_data['city']
-                weather_info = await get_weather(city)
+                weather_info = await get_weather(city, locale)
                 await send_message_with_retries(context.bot, update.effective_chat.id, weather_info)
             else:
                 await request_city(update, context)
-        elif text == 'Курс гривны':
+        elif text == message('button_forecast', locale):
+            await send_forecast(update, context)
+        elif text == message('button_currency', locale):
             await get_currency_rate(update, context)
     except Exception as e:
-        logger.error(f"Ошибка при обработке кнопки: {e}")
+        logger.error("Ошибка при обработке кнопки: %s", e)
+
+async def send_forecast(update, context):
+    user_data = await load_user_data_async(update.effective_user.id)
+    if user_data and user_data.get('city'):
+        forecast_info = await get_forecast(user_data['city'], get_locale(context))
+        await send_message_with_retries(context.bot, update.effective_chat.id, forecast_info)
+    else:
+        await request_city(update, context)
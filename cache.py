@@ -0,0 +1,215 @@
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class StaleCache:
+    # Кэш, который после истечения ttl ещё stale_ttl секунд отдаёт устаревшие данные,
+    # пока вызывающий код обновляет их в фоне (stale-while-revalidate)
+    def __init__(self, maxsize, ttl, stale_ttl=0, timer=time.time):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._timer = timer
+        self._data = TTLCache(maxsize=maxsize, ttl=ttl + stale_ttl, timer=timer)
+
+    def _entry(self, key):
+        value, stored_at = self._data[key]
+        if self._timer() - stored_at >= self.ttl + self.stale_ttl:
+            del self._data[key]
+            raise KeyError(key)
+        return value, stored_at
+
+    def set(self, key, value, stored_at=None):
+        self._data[key] = (value, self._timer() if stored_at is None else stored_at)
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __getitem__(self, key):
+        return self._entry(key)[0]
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __contains__(self, key):
+        try:
+            self._entry(key)
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def lookup(self, key):
+        # Возвращает (значение, свежее ли оно) или (None, False) при промахе
+        try:
+            value, stored_at = self._entry(key)
+        except KeyError:
+            return None, False
+        return value, self._timer() - stored_at < self.ttl
+
+    def age(self, key):
+        # Сколько секунд назад сохранена запись; None при промахе
+        try:
+            return self._timer() - self._entry(key)[1]
+        except KeyError:
+            return None
+
+    def clear(self):
+        self._data.clear()
+
+    def open(self):
+        pass
+
+    async def sync(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class PersistentStaleCache(StaleCache):
+    # StaleCache с копией записей в SQLite. Обращения к кэшу работают только с памятью:
+    # записи загружаются с диска при открытии, изменения копятся и записываются пакетом,
+    # а sync подтягивает записи других процессов. Дисковые операции выполняются в потоке,
+    # чтобы не блокировать цикл событий.
+    def __init__(self, path, namespace, maxsize, ttl, stale_ttl=0, timer=time.time):
+        super().__init__(maxsize, ttl, stale_ttl, timer)
+        self.path = path
+        self.namespace = namespace
+        self._conn = None
+        self._db_lock = threading.Lock()
+        self._pending = {}  # ключ -> (значение, время сохранения) или None для удаления
+        self._pending_clear = False
+        self._pending_lock = threading.Lock()
+        self._synced_version = -1  # версия последней прочитанной с диска записи; у старых записей 0
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, stored_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            # Версия растёт с каждой записью и задаёт порядок фиксации: по stored_at нельзя,
+            # запись с более ранним stored_at может попасть на диск позже
+            if 'version' not in [row[1] for row in conn.execute("PRAGMA table_info(cache)")]:
+                conn.execute("ALTER TABLE cache ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_version ON cache (namespace, version)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_versions (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)")
+            expired_before = self._timer() - self.ttl - self.stale_ttl
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND stored_at < ?", (self.namespace, expired_before))
+            conn.commit()
+            self._conn = conn
+            logger.info("Постоянный кэш %s открыт: %s", self.namespace, self.path)
+        return self._conn
+
+    def set(self, key, value, stored_at=None):
+        super().set(key, value, stored_at)
+        with self._pending_lock:
+            self._pending[key] = self._data[key]
+
+    def __delitem__(self, key):
+        self._data.pop(key, None)
+        with self._pending_lock:
+            self._pending[key] = None
+
+    def clear(self):
+        super().clear()
+        with self._pending_lock:
+            self._pending.clear()
+            self._pending_clear = True
+
+    def flush(self):
+        # Запись накопленных изменений одной транзакцией; вызывается в потоке
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            clear, self._pending_clear = self._pending_clear, False
+        if not pending and not clear:
+            return
+        try:
+            with self._db_lock:
+                conn = self._connect()
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute(
+                        "INSERT INTO cache_versions (id, version) VALUES (0, 1) "
+                        "ON CONFLICT(id) DO UPDATE SET version = version + 1"
+                    )
+                    version = conn.execute("SELECT version FROM cache_versions WHERE id = 0").fetchone()[0]
+                    if clear:
+                        conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO cache (namespace, key, value, stored_at, version) VALUES (?, ?, ?, ?, ?)",
+                        [(self.namespace, json.dumps(key), json.dumps(entry[0], ensure_ascii=False), entry[1], version)
+                         for key, entry in pending.items() if entry is not None],
+                    )
+                    conn.executemany(
+                        "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                        [(self.namespace, json.dumps(key)) for key, entry in pending.items() if entry is None],
+                    )
+        except sqlite3.Error as e:
+            logger.error("Ошибка записи в постоянный кэш %s: %s", self.namespace, e)
+            with self._pending_lock:
+                # Более новые изменения, сделанные во время записи, не перезаписываются
+                self._pending = {**pending, **self._pending}
+                self._pending_clear = self._pending_clear or clear
+        else:
+            logger.debug("Постоянный кэш %s: записано %d изменений.", self.namespace, len(pending))
+
+    def _read_since(self, version):
+        # Записи, сохранённые после version; вызывается в потоке
+        try:
+            with self._db_lock:
+                rows = self._connect().execute(
+                    "SELECT key, value, stored_at, version FROM cache WHERE namespace = ? AND version > ?",
+                    (self.namespace, version),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Ошибка чтения постоянного кэша %s: %s", self.namespace, e)
+            return []
+        return [(json.loads(key), json.loads(value), stored_at, version) for key, value, stored_at, version in rows]
+
+    async def sync(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.flush)
+        rows = await loop.run_in_executor(None, self._read_since, self._synced_version)
+        expired_before = self._timer() - self.ttl - self.stale_ttl
+        for key, value, stored_at, version in rows:
+            self._synced_version = max(self._synced_version, version)
+            current = self._data.get(key)
+            if stored_at > expired_before and (current is None or current[1] < stored_at):
+                StaleCache.set(self, key, value, stored_at)
+
+    def open(self):
+        with self._db_lock:
+            self._connect()
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def make_cache(namespace, maxsize, ttl, stale_ttl=0, path=None):
+    if path:
+        return PersistentStaleCache(path, namespace, maxsize, ttl, stale_ttl)
+    return StaleCache(maxsize, ttl, stale_ttl)
@@ -0,0 +1,70 @@
+import time
+import logging
+from collections import deque
+from config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, UPSTREAM_MIN_TIMEOUT, UPSTREAM_MAX_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    # Размыкается после серии ошибок внешнего API и сразу отклоняет запросы;
+    # через reset_timeout пропускает один пробный запрос (полуоткрытое состояние).
+    # Таймаут подстраивается под перцентиль задержек последних успешных запросов.
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                 min_timeout=UPSTREAM_MIN_TIMEOUT, max_timeout=UPSTREAM_MAX_TIMEOUT,
+                 percentile=0.99, multiplier=2.0, window=200, timer=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self._timer = timer
+        self._latencies = deque(maxlen=window)
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+
+    def timeout(self):
+        if len(self._latencies) < 10:
+            return self.max_timeout
+        latencies = sorted(self._latencies)
+        latency = latencies[int(self.percentile * (len(latencies) - 1))]
+        return min(self.max_timeout, max(self.min_timeout, latency * self.multiplier))
+
+    def allow(self):
+        if self.state == CLOSED:
+            return True
+        now = self._timer()
+        if self.state == OPEN:
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            logger.info("Цепь %s полуоткрыта, пробный запрос.", self.name)
+        # Пробный запрос один; если он завис, через reset_timeout разрешается следующий
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            return False
+        self._probe_started = now
+        return True
+
+    def record_success(self, latency):
+        self._latencies.append(latency)
+        self.failures = 0
+        self._probe_started = None
+        if self.state != CLOSED:
+            logger.info("Цепь %s замкнута, внешний API снова доступен.", self.name)
+            self.state = CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_started = None
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning("Цепь %s разомкнута после %d ошибок.", self.name, self.failures)
+            self.state = OPEN
+            self._opened_at = self._timer()
@@ -0,0 +1,124 @@
+import json
+import math
+import bisect
+import difflib
+import logging
+from collections import namedtuple
+from config import CITY_INDEX_PATH, GEO_GRID_STEP, GEO_NEAREST_RADIUS
+
+logger = logging.getLogger(__name__)
+
+City = namedtuple('City', 'name country lat lon id')
+
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'ґ': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'є': 'ye',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'і': 'i', 'ї': 'yi', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh',
+    'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', "'": '', '’': '',
+}
+
+def normalize_name(text):
+    return ' '.join(text.replace('-', ' ').split()).casefold().replace('ё', 'е')
+
+def transliterate(text):
+    return ''.join(_TRANSLIT.get(char, char) for char in text)
+
+def snap(lat, lon, step=GEO_GRID_STEP):
+    # Центр ячейки сетки, в которую попадают координаты
+    return round(round(lat / step) * step, 4), round(round(lon / step) * step, 4)
+
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+class CityIndex:
+    # Названия, синонимы и их транслитерация -> город с координатами.
+    # match находит город только по точному названию; однозначный префикс и нечёткое
+    # совпадение (suggest) служат лишь подсказкой, когда OpenWeatherMap город не нашёл,
+    # иначе "Николаевка" молча превращалась бы в Николаев.
+    def __init__(self, path=CITY_INDEX_PATH):
+        self.path = path
+        self._loaded = False
+        self._names = {}  # нормализованное название -> (город, написание)
+        self._sorted = []  # нормализованные названия для поиска по префиксу
+        self._by_initial = {}  # первая буква -> названия для нечёткого поиска
+        self._cells = {}  # градусная ячейка -> города в ней
+        self._unsorted = False
+
+    def load(self):
+        if not self._loaded:
+            self._load()
+
+    def _load(self):
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            logger.warning("Индекс городов %s не найден, поиск только через OpenWeatherMap.", self.path)
+            return
+        except (OSError, ValueError) as e:
+            logger.error("Ошибка загрузки индекса городов %s: %s", self.path, e)
+            return
+        for record in records:
+            self.add(City(record['name'], record.get('country'), record['coord']['lat'], record['coord']['lon'], record.get('id')),
+                     record.get('aliases', ()))
+        logger.info("Индекс городов загружен: %d городов, %d названий.", sum(map(len, self._cells.values())), len(self._names))
+
+    def add(self, city, aliases=()):
+        for name in (city.name, *aliases):
+            key = normalize_name(name)
+            for variant in {key, transliterate(key)}:
+                if variant and variant not in self._names:
+                    self._names[variant] = (city, name)
+                    self._sorted.append(variant)
+                    self._unsorted = True
+                    self._by_initial.setdefault(variant[0], []).append(variant)
+        self._cells.setdefault((math.floor(city.lat), math.floor(city.lon)), []).append(city)
+
+    def match(self, text):
+        # Возвращает (город, написание) или None
+        self.load()
+        key = normalize_name(text)
+        if not key:
+            return None
+        return self._names.get(key) or self._names.get(transliterate(key))
+
+    def suggest(self, text):
+        # Похожий город для подсказки пользователю: (город, написание) или None
+        self.load()
+        key = normalize_name(text)
+        if not key:
+            return None
+        if len(key) >= 3:
+            if self._unsorted:
+                # Сортировка один раз после загрузки, а не при добавлении каждого названия
+                self._sorted.sort()
+                self._unsorted = False
+            start = bisect.bisect_left(self._sorted, key)
+            end = bisect.bisect_right(self._sorted, key + '\uffff')
+            candidates = {self._names[name][0] for name in self._sorted[start:end]}
+            if len(candidates) == 1:
+                return self._names[self._sorted[start]]
+        candidates = [name for name in self._by_initial.get(key[0], ()) if abs(len(name) - len(key)) <= 2]
+        close = difflib.get_close_matches(key, candidates, n=1, cutoff=0.8)
+        if close:
+            logger.debug("Город %s распознан как %s.", text, close[0])
+            return self._names[close[0]]
+        return None
+
+    def nearest(self, lat, lon, radius_km=GEO_NEAREST_RADIUS):
+        self.load()
+        best, best_distance = None, radius_km
+        cell_lat, cell_lon = math.floor(lat), math.floor(lon)
+        for d_lat in (-1, 0, 1):
+            for d_lon in (-1, 0, 1):
+                for city in self._cells.get((cell_lat + d_lat, cell_lon + d_lon), ()):
+                    distance = distance_km(lat, lon, city.lat, city.lon)
+                    if distance <= best_distance:
+                        best, best_distance = city, distance
+        return best
+
+city_index = CityIndex()
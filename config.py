@@ -1,22 +1,144 @@
 import os
 import logging
-from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
 
-if not os.path.isfile('.env'):
-    logger.error("Файл .env не найден. Убедитесь, что файл .env присутствует в корневой директории проекта.")
-    raise FileNotFoundError("Файл .env не найден.")
-load_dotenv()
-logger.info("Файл .env успешно загружен.")
+# Файл .env необязателен: переменные могут быть заданы в окружении процесса.
+# Значения из окружения имеют приоритет над .env.
+ENV_FILE = os.getenv("ENV_FILE", ".env")
+if os.path.isfile(ENV_FILE):
+    from dotenv import load_dotenv
+    load_dotenv(ENV_FILE)
+    logger.info("Файл %s успешно загружен.", ENV_FILE)
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
 CURRENCY_API_KEY = os.getenv("CURRENCY_API_KEY")
+# Адреса внешних API (переопределяются для нагрузочных тестов)
+OWM_API_URL = os.getenv("OWM_API_URL", "http://api.openweathermap.org/data/2.5")
+OXR_API_URL = os.getenv("OXR_API_URL", "https://openexchangerates.org/api")
 
-if not TELEGRAM_TOKEN:
-    raise ValueError("TELEGRAM_TOKEN отсутствует. Убедитесь, что он указан в файле .env")
-if not WEATHER_API_KEY:
-    raise ValueError("WEATHER_API_KEY отсутствует. Убедитесь, что он указан в файле .env")
-if not CURRENCY_API_KEY:
-    raise ValueError("CURRENCY_API_KEY отсутствует. Убедитесь, что он указан в файле .env")
+def check_required_settings(names=("TELEGRAM_TOKEN", "WEATHER_API_KEY", "CURRENCY_API_KEY")):
+    # Проверяется при сборке приложения, а не при импорте модуля
+    for name in names:
+        if not globals()[name]:
+            raise ValueError(f"{name} отсутствует. Укажите его в переменных окружения или в файле {ENV_FILE}")
+
+# Хранилище профилей пользователей. Ограничение потерь при сбое: изменения сбрасываются
+# на диск не реже чем раз в USER_DATA_FLUSH_INTERVAL секунд или при накоплении
+# USER_DATA_MAX_DIRTY изменений; дисковые операции выполняются в USER_DATA_IO_WORKERS потоках
+USER_DB_FILE = os.getenv("USER_DB_FILE", "user_data.db")
+USER_DATA_FLUSH_INTERVAL = float(os.getenv("USER_DATA_FLUSH_INTERVAL", "5"))
+USER_DATA_MAX_DIRTY = int(os.getenv("USER_DATA_MAX_DIRTY", "100"))
+USER_DATA_IO_WORKERS = int(os.getenv("USER_DATA_IO_WORKERS", "2"))
+
+# Общее состояние процессов: local - один процесс; sqlite - несколько процессов с общим файлом
+STATE_BACKEND = os.getenv("STATE_BACKEND", "local")
+STATE_DB_FILE = os.getenv("STATE_DB_FILE", "state.db")
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "30"))
+# Число процессов бота при запуске через workers.py
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 2)))
+
+# Число готовых текстов ответов в кэше отрисовки
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "10000"))
+
+# Параметры пула HTTP-соединений к внешним API
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+
+# Параметры кэша погоды
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "5000"))
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_STALE_TTL = int(os.getenv("WEATHER_CACHE_STALE_TTL", "3600"))
+CITY_ALIAS_CACHE_SIZE = int(os.getenv("CITY_ALIAS_CACHE_SIZE", "20000"))
+CITY_ALIAS_CACHE_TTL = int(os.getenv("CITY_ALIAS_CACHE_TTL", "86400"))
+# Путь к файлу SQLite для постоянного кэша; пусто - кэш только в памяти
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "")
+# Как часто (в секундах) изменения постоянного кэша записываются на диск
+# и подтягиваются записи других процессов
+CACHE_SYNC_INTERVAL = float(os.getenv("CACHE_SYNC_INTERVAL", "5"))
+
+# Параметры рассылки погоды подписчикам
+BROADCAST_INTERVAL = int(os.getenv("BROADCAST_INTERVAL", "7200"))
+BROADCAST_SLOTS = int(os.getenv("BROADCAST_SLOTS", "12"))
+# Оповещения об изменении погоды: интервал проверки и пороги по умолчанию
+ALERT_CHECK_INTERVAL = int(os.getenv("ALERT_CHECK_INTERVAL", "1800"))
+ALERT_TEMP_DELTA = float(os.getenv("ALERT_TEMP_DELTA", "3"))
+ALERT_PRESSURE_DROP = float(os.getenv("ALERT_PRESSURE_DROP", "5"))
+
+# Ограничения скорости исходящих сообщений (лимиты Telegram)
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+
+# Ограничение входящих сообщений на пользователя (в секунду и запас) и окно в секундах,
+# в течение которого повтор того же текста получает прежний ответ
+INBOUND_RATE = float(os.getenv("INBOUND_RATE", "1"))
+INBOUND_BURST = int(os.getenv("INBOUND_BURST", "5"))
+INBOUND_DEDUP_WINDOW = float(os.getenv("INBOUND_DEDUP_WINDOW", "10"))
+
+# Параметры снимка курсов валют
+CURRENCY_REFRESH_INTERVAL = int(os.getenv("CURRENCY_REFRESH_INTERVAL", "3600"))
+CURRENCY_STALE_TTL = int(os.getenv("CURRENCY_STALE_TTL", "604800"))
+
+# Боты процесса: "профиль[:язык][@ПЕРЕМЕННАЯ_С_ТОКЕНОМ]" через запятую (см. profiles.py)
+BOT_PROFILES = os.getenv("BOT_PROFILES", "menu:ru")
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Несколько процессов могут слушать один порт (см. workers.py)
+WEBHOOK_REUSE_PORT = os.getenv("WEBHOOK_REUSE_PORT", "") == "1"
+# Число обновлений, обрабатываемых одновременно
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+
+# Одновременных запросов при массовом получении погоды
+WEATHER_BULK_CONCURRENCY = int(os.getenv("WEATHER_BULK_CONCURRENCY", "10"))
+# Прогрев кэша погоды для городов подписчиков при запуске
+WEATHER_PREWARM = os.getenv("WEATHER_PREWARM", "") == "1"
+
+# Автоматический выключатель и адаптивный таймаут для внешних API
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+UPSTREAM_MIN_TIMEOUT = float(os.getenv("UPSTREAM_MIN_TIMEOUT", "1"))
+UPSTREAM_MAX_TIMEOUT = float(os.getenv("UPSTREAM_MAX_TIMEOUT", str(HTTP_TIMEOUT)))
+
+# Квоты ключей внешних API: вызовов в минуту и в календарный месяц (UTC), 0 - без ограничения.
+# По умолчанию - бесплатные тарифы OpenWeatherMap и openexchangerates
+OWM_CALLS_PER_MINUTE = int(os.getenv("OWM_CALLS_PER_MINUTE", "60"))
+OWM_CALLS_PER_MONTH = int(os.getenv("OWM_CALLS_PER_MONTH", "1000000"))
+OXR_CALLS_PER_MINUTE = int(os.getenv("OXR_CALLS_PER_MINUTE", "0"))
+OXR_CALLS_PER_MONTH = int(os.getenv("OXR_CALLS_PER_MONTH", "1000"))
+# Доля квоты, доступная только интерактивным запросам; фоновые обновления её не расходуют
+UPSTREAM_BUDGET_RESERVE = float(os.getenv("UPSTREAM_BUDGET_RESERVE", "0.2"))
+# Сколько секунд интерактивный запрос может ждать начала следующей минуты
+UPSTREAM_BUDGET_MAX_WAIT = float(os.getenv("UPSTREAM_BUDGET_MAX_WAIT", "3"))
+
+# Адрес HTTP-эндпоинта метрик в формате Prometheus; порт 0 отключает его.
+# Процессы workers.py слушают порты METRICS_PORT, METRICS_PORT + 1 и т. д.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Как часто (в секундах) обновляются метрики, для которых нужен запрос к хранилищу
+METRICS_REFRESH_INTERVAL = float(os.getenv("METRICS_REFRESH_INTERVAL", "15"))
+
+# Локальный индекс городов: файл в формате city.list.json OpenWeatherMap
+# (id, name, country, coord) с необязательным списком aliases
+CITY_INDEX_PATH = os.getenv("CITY_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cities.json"))
+# Шаг сетки в градусах: близкие координаты используют общую запись кэша
+GEO_GRID_STEP = float(os.getenv("GEO_GRID_STEP", "0.1"))
+# Радиус в км, в котором геолокация привязывается к городу из индекса
+GEO_NEAREST_RADIUS = float(os.getenv("GEO_NEAREST_RADIUS", "25"))
+
+# Параметры прогноза погоды (OpenWeatherMap обновляет его раз в 3 часа)
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "2000"))
+FORECAST_TTL = int(os.getenv("FORECAST_TTL", "10800"))
+FORECAST_STALE_TTL = int(os.getenv("FORECAST_STALE_TTL", "10800"))
+FORECAST_REFRESH_INTERVAL = int(os.getenv("FORECAST_REFRESH_INTERVAL", "900"))
+FORECAST_DAYS = int(os.getenv("FORECAST_DAYS", "5"))
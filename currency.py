@@ -1,46 +1,98 @@
+import time
 import aiohttp
 import asyncio
 import logging
-from telegram import Update, CallbackQuery
-from telegram.ext import CallbackContext
 from message_utils import send_message_with_retries
-from config import CURRENCY_API_KEY
+from config import CURRENCY_API_KEY, OXR_API_URL, CURRENCY_REFRESH_INTERVAL, CURRENCY_STALE_TTL, CACHE_DB_PATH, OXR_CALLS_PER_MINUTE, OXR_CALLS_PER_MONTH
+from http_client import get_http_session
+from singleflight import SingleFlight
+from cache import make_cache
+from render import render_currency, message
+from circuit import CircuitBreaker
+from budget import UpstreamBudget, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from metrics import cache_requests, upstream_latency, upstream_errors
+from backend import backend
 
 logger = logging.getLogger(__name__)
 
-currency_emojis = {
-    "USD": "🇺🇸",  # Флаг США
-    "EUR": "🇪🇺",  # Флаг Европейского Союза
-    "GBP": "🇬🇧",  # Флаг Великобритании
-    "JPY": "🇯🇵",  # Флаг Японии
-    "RUB": "🇷🇺"   # Флаг России
-}
+SNAPSHOT_KEY = 'latest'
 
-async def get_currency_rate(query: CallbackQuery, context: CallbackContext):
-    url = f"https://openexchangerates.org/api/latest.json?app_id={CURRENCY_API_KEY}"
-    chat_id = query.message.chat_id
+# Последний успешно полученный ответ openexchangerates; устаревший снимок
+# хранится ещё CURRENCY_STALE_TTL секунд на случай недоступности API
+currency_cache = make_cache('currency', 1, CURRENCY_REFRESH_INTERVAL, CURRENCY_STALE_TTL, path=CACHE_DB_PATH)
+currency_requests = SingleFlight()
+oxr_circuit = CircuitBreaker('openexchangerates')
+oxr_budget = UpstreamBudget('openexchangerates', {'minute': OXR_CALLS_PER_MINUTE, 'month': OXR_CALLS_PER_MONTH})
+_background_tasks = set()
+
+class CurrencyError(Exception):
+    # key - ключ текста ошибки в render.MESSAGES
+    def __init__(self, key):
+        super().__init__(message(key))
+        self.key = key
+
+    def text(self, locale='ru'):
+        return message(self.key, locale)
 
-    logger.info(f"Отправка запроса на URL: {url}")
+async def request_currency_rates(priority=PRIORITY_INTERACTIVE):
+    if not oxr_circuit.allow():
+        logger.warning("Запрос курсов валют пропущен: цепь разомкнута.")
+        raise CurrencyError('currency_unavailable')
+    if not await oxr_budget.acquire(priority):
+        raise CurrencyError('currency_quota')
 
+    url = f"{OXR_API_URL}/latest.json"
+    logger.info("Запрос курсов валют.")
+
+    started = time.monotonic()
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as response:
-                logger.info(f"Получен ответ с кодом состояния: {response.status}")
-                if response.status == 200:
-                    data = await response.json()
-                    rates = data['rates']
-                    uah_rate = rates['UAH']
-                    message = (
-                        f"Курс гривны (UAH):\n"
-                        f"USD: {1 / rates['USD'] * uah_rate:.2f} {currency_emojis['USD']}\n"
-                        f"EUR: {1 / rates['EUR'] * uah_rate:.2f} {currency_emojis['EUR']}\n"
-                        f"GBP: {1 / rates['GBP'] * uah_rate:.2f} {currency_emojis['GBP']}\n"
-                        f"JPY: {1 / rates['JPY'] * uah_rate:.2f} {currency_emojis['JPY']}\n"
-                        f"RUB: {1 / rates['RUB'] * uah_rate:.2f} {currency_emojis['RUB']}\n"
-                    )
-                    await send_message_with_retries(context.bot, chat_id, message)
-                else:
-                    await send_message_with_retries(context.bot, chat_id, "Не удалось получить данные о курсах валют.")
+        session = await get_http_session()
+        timeout = aiohttp.ClientTimeout(total=oxr_circuit.timeout())
+        async with session.get(url, params={'app_id': CURRENCY_API_KEY}, timeout=timeout) as response:
+            logger.debug("Получен ответ с кодом состояния: %s", response.status)
+            upstream_latency.observe(time.monotonic() - started, 'openexchangerates')
+            if response.status == 200:
+                data = await response.json()
+                oxr_circuit.record_success(time.monotonic() - started)
+                snapshot = {'timestamp': data['timestamp'], 'rates': data['rates']}
+                currency_cache[SNAPSHOT_KEY] = snapshot
+                return snapshot
+            oxr_circuit.record_failure()
+            upstream_errors.inc('openexchangerates')
+            raise CurrencyError('currency_failed')
     except (asyncio.TimeoutError, aiohttp.ClientError, aiohttp.ServerTimeoutError) as e:
-        logger.error(f"Ошибка при получении данных о курсах валют: {e}")
-        await send_message_with_retries(context.bot, chat_id, "Произошла ошибка при получении данных о курсах валют. Попробуйте снова позже.")
+        oxr_circuit.record_failure()
+        upstream_errors.inc('openexchangerates')
+        logger.error("Ошибка при получении данных о курсах валют: %s", e)
+        raise CurrencyError('currency_error')
+
+async def refresh_currency_rates(context=None):
+    # Плановое и фоновое обновление не расходует резерв квоты для пользователей
+    try:
+        await currency_requests.do(SNAPSHOT_KEY, request_currency_rates, PRIORITY_BACKGROUND)
+    except CurrencyError as e:
+        logger.warning("Не удалось обновить курсы валют, используется последний снимок: %s", e)
+
+async def get_currency_snapshot():
+    # Возвращает (снимок, свежий ли он); при пустом кэше ждёт первого запроса
+    snapshot, fresh = currency_cache.lookup(SNAPSHOT_KEY)
+    if snapshot is None:
+        cache_requests.inc('currency', 'miss')
+        return await currency_requests.do(SNAPSHOT_KEY, request_currency_rates), True
+    cache_requests.inc('currency', 'hit' if fresh else 'stale')
+    # При общем состоянии снимок обновляет лидер, остальные процессы отдают устаревший
+    if not fresh and not backend.shared and SNAPSHOT_KEY not in currency_requests:
+        task = asyncio.ensure_future(refresh_currency_rates())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    return snapshot, fresh
+
+async def get_currency_rate(query, context):
+    chat_id = query.message.chat_id
+    locale = context.bot_data.get('locale', 'ru')
+    try:
+        snapshot, fresh = await get_currency_snapshot()
+    except CurrencyError as e:
+        await send_message_with_retries(context.bot, chat_id, e.text(locale))
+        return
+    await send_message_with_retries(context.bot, chat_id, render_currency(snapshot, fresh, locale))
@@ -0,0 +1,131 @@
+import time
+import asyncio
+import logging
+from config import FORECAST_CACHE_SIZE, FORECAST_TTL, FORECAST_STALE_TTL, FORECAST_DAYS
+from weather import WeatherError, request_owm, resolve_city, city_ids, city_not_found_text
+from budget import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from singleflight import SingleFlight
+from cache import StaleCache
+from render import render_forecast, message
+from metrics import cache_requests
+
+logger = logging.getLogger(__name__)
+
+# id города -> почасовой ряд прогноза, общий для всех пользователей
+forecast_cache = StaleCache(FORECAST_CACHE_SIZE, FORECAST_TTL, FORECAST_STALE_TTL)
+forecast_requests = SingleFlight()
+# id городов, прогноз которых запрашивали после последнего планового обновления
+_requested_ids = set()
+
+class HourlySeries:
+    # Прогноз OpenWeatherMap с шагом 3 часа, хранится по столбцам в массивах NumPy
+    __slots__ = ('city_id', 'name', 'utc_offset', 'fetched_at', 'times', 'temp', 'precip', 'pop', 'condition', 'descriptions')
+
+    def __init__(self, data):
+        # NumPy импортируется при первом прогнозе, а не при запуске бота
+        import numpy as np
+        city = data.get('city', {})
+        items = data.get('list', [])
+        self.city_id = city.get('id')
+        self.name = city.get('name')
+        self.utc_offset = city.get('timezone', 0)
+        self.fetched_at = time.time()
+        self.times = np.fromiter((item['dt'] for item in items), dtype=np.int64, count=len(items))
+        self.temp = np.fromiter((item['main']['temp'] for item in items), dtype=np.float32, count=len(items))
+        self.precip = np.fromiter(
+            (item.get('rain', {}).get('3h', 0) + item.get('snow', {}).get('3h', 0) for item in items),
+            dtype=np.float32, count=len(items),
+        )
+        self.pop = np.fromiter((item.get('pop', 0) for item in items), dtype=np.float32, count=len(items))
+        # Описания погоды хранятся один раз, в ряду - только их номера
+        codes = {}
+        self.condition = np.fromiter(
+            (codes.setdefault(item['weather'][0]['description'], len(codes)) for item in items),
+            dtype=np.int16, count=len(items),
+        )
+        self.descriptions = list(codes)
+
+    def daily(self, days=FORECAST_DAYS):
+        # Сводка по местным суткам: (дата, мин., макс., осадки мм, вероятность осадков, описание около полудня)
+        import numpy as np
+        if not len(self.times):
+            return []
+        local = self.times + self.utc_offset
+        day = local // 86400
+        starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])[:days]
+        end = starts[-1] + np.count_nonzero(day == day[starts[-1]])
+        local, day = local[:end], day[:end]
+        low = np.minimum.reduceat(self.temp[:end], starts)
+        high = np.maximum.reduceat(self.temp[:end], starts)
+        precip = np.add.reduceat(self.precip[:end], starts)
+        pop = np.maximum.reduceat(self.pop[:end], starts)
+        # В пределах суток отсчёты упорядочены по удалённости от полудня
+        midday = np.lexsort((np.abs(local % 86400 - 43200), day))[starts]
+        return [
+            (int(day[start]) * 86400, float(low[i]), float(high[i]), float(precip[i]), float(pop[i]),
+             self.descriptions[self.condition[midday[i]]])
+            for i, start in enumerate(starts)
+        ]
+
+async def request_forecast(params, key=None, priority=PRIORITY_INTERACTIVE):
+    data = await request_owm('forecast', params, priority)
+    series = HourlySeries(data)
+    if not series.city_id:
+        # Для координат вне городов OpenWeatherMap возвращает id 0, такие прогнозы не кэшируются
+        return series
+    forecast_cache[series.city_id] = series
+    if key is not None and key not in city_ids:
+        city_ids[key] = series.city_id
+    return series
+
+async def load_forecast(key, params):
+    city_id = city_ids.get(key)
+    if city_id is not None:
+        _requested_ids.add(city_id)
+        series, fresh = forecast_cache.lookup(city_id)
+        if series is not None:
+            cache_requests.inc('forecast', 'hit' if fresh else 'stale')
+            if not fresh:
+                # Устаревший прогноз отдаётся сразу, обновление - плановой задачей
+                logger.debug("Прогноз для города %s устарел.", key)
+            return series
+        cache_requests.inc('forecast', 'miss')
+        return await forecast_requests.do(city_id, request_forecast, {'id': city_id})
+    cache_requests.inc('forecast', 'miss')
+    series = await forecast_requests.do(key, request_forecast, params, key)
+    if series.city_id:
+        _requested_ids.add(series.city_id)
+    return series
+
+async def get_forecast(city, locale='ru'):
+    if not city:
+        logger.warning("Название города не может быть пустым.")
+        return message('empty_city', locale)
+
+    key, params, name = resolve_city(city)
+    try:
+        series = await load_forecast(key, params)
+    except WeatherError as e:
+        if e.key == 'city_not_found':
+            return city_not_found_text(city, locale)
+        return e.text(locale)
+    return render_forecast(series, name, locale)
+
+async def refresh_forecasts(context=None):
+    # Плановое обновление прогнозов городов, которые запрашивали с прошлого обновления
+    # Свежие прогнозы остаются в очереди до истечения их срока
+    stale = [city_id for city_id in _requested_ids if not forecast_cache.lookup(city_id)[1]]
+    if not stale:
+        return
+    _requested_ids.difference_update(stale)
+    logger.info("Обновление прогноза для %d городов.", len(stale))
+    results = await asyncio.gather(
+        *(forecast_requests.do(city_id, request_forecast, {'id': city_id}, None, PRIORITY_BACKGROUND) for city_id in stale),
+        return_exceptions=True,
+    )
+    for city_id, result in zip(stale, results):
+        if isinstance(result, WeatherError) and result.key == 'weather_quota':
+            # Отложено до следующего планового обновления
+            _requested_ids.add(city_id)
+        elif isinstance(result, Exception):
+            logger.error("Ошибка обновления прогноза для города %s: %s", city_id, result)
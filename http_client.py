@@ -0,0 +1,35 @@
+import logging
+import aiohttp
+from config import HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST, HTTP_DNS_CACHE_TTL, HTTP_KEEPALIVE_TIMEOUT, HTTP_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Общая HTTP-сессия на всё время работы приложения
+_session = None
+
+async def init_http_session():
+    global _session
+    if _session is not None and not _session.closed:
+        return _session
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    )
+    _session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT))
+    logger.info("HTTP-сессия открыта (limit=%s, limit_per_host=%s).", HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST)
+    return _session
+
+async def close_http_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("HTTP-сессия закрыта.")
+    _session = None
+
+async def get_http_session():
+    # Ленивое открытие на случай вызова до запуска приложения
+    if _session is None or _session.closed:
+        return await init_http_session()
+    return _session
@@ -0,0 +1,80 @@
+import time
+import logging
+from collections import deque
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, TypeHandler
+from config import INBOUND_RATE, INBOUND_BURST, INBOUND_DEDUP_WINDOW
+from message_utils import TokenBucket, MAX_IDLE_CHAT_BUCKETS, capture_replies, send_message_with_retries
+from metrics import inbound_rejected
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних update_id помнить для отбрасывания повторной доставки
+RECENT_UPDATE_IDS = 1000
+
+class InboundGuard:
+    # Проверка входящих обновлений до обработчиков, без обращений к хранилищу и внешним API:
+    # повторно доставленные обновления и сообщения сверх лимита пользователя отбрасываются,
+    # тот же текст в течение dedup_window получает последний ответ без повторной обработки
+    def __init__(self, rate=INBOUND_RATE, burst=INBOUND_BURST, dedup_window=INBOUND_DEDUP_WINDOW, timer=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.dedup_window = dedup_window
+        self._timer = timer
+        self._buckets = {}  # user_id -> TokenBucket
+        self._recent = {}  # user_id -> (текст, время, ответы на него)
+        self._update_ids = set()
+        self._update_order = deque()
+
+    def _bucket(self, user_id):
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_IDLE_CHAT_BUCKETS:
+                self._buckets = {key: value for key, value in self._buckets.items() if not value.full}
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst, timer=self._timer)
+        return bucket
+
+    def _seen(self, update_id):
+        if update_id in self._update_ids:
+            return True
+        self._update_ids.add(update_id)
+        self._update_order.append(update_id)
+        if len(self._update_order) > RECENT_UPDATE_IDS:
+            self._update_ids.discard(self._update_order.popleft())
+        return False
+
+    async def check(self, update: Update, context):
+        if self._seen(update.update_id):
+            inbound_rejected.inc('redelivered')
+            raise ApplicationHandlerStop
+        user = update.effective_user
+        if user is None:
+            capture_replies(False)
+            return
+        if self._bucket(user.id).consume() > 0:
+            inbound_rejected.inc('rate')
+            logger.debug("Сообщение пользователя %s отклонено: превышен лимит.", user.id)
+            raise ApplicationHandlerStop
+        text = update.message.text if update.message else None
+        if not text:
+            capture_replies(False)
+            return
+        now = self._timer()
+        recent = self._recent.get(user.id)
+        if recent is not None and recent[0] == text and now - recent[1] < self.dedup_window:
+            inbound_rejected.inc('duplicate')
+            logger.debug("Повтор сообщения пользователя %s, отправляется прежний ответ.", user.id)
+            # Пока первое сообщение обрабатывается, список ответов пуст и повтор просто отбрасывается.
+            # При последовательной обработке в контексте ещё активен список первого сообщения,
+            # поэтому запись ответов выключается, иначе повтор дописал бы их туда же
+            capture_replies(False)
+            for chat_id, reply, kwargs in list(recent[2]):
+                await send_message_with_retries(context.bot, chat_id, reply, **kwargs)
+            raise ApplicationHandlerStop
+        if len(self._recent) >= MAX_IDLE_CHAT_BUCKETS:
+            self._recent = {key: value for key, value in self._recent.items() if now - value[1] < self.dedup_window}
+        self._recent[user.id] = (text, now, capture_replies())
+
+def setup_inbound(application):
+    # Группа -1 выполняется раньше обработчиков профиля
+    application.add_handler(TypeHandler(Update, InboundGuard().check), group=-1)
@@ -1,75 +1,236 @@
+import time
+_import_started = time.perf_counter()
+
+import os
+import signal
+import asyncio
 import logging
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext
-from config import TELEGRAM_TOKEN
-from user_data import save_user_data, load_user_data
-from buttons import show_menu, button
-from message_utils import send_message_with_retries
-from utils import request_city
-from weather import get_weather
-
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from telegram.ext import Application, CallbackContext
+from config import (
+    TELEGRAM_TOKEN, CURRENCY_REFRESH_INTERVAL, CACHE_SYNC_INTERVAL, FORECAST_REFRESH_INTERVAL, BOT_MODE, BOT_PROFILES, CONCURRENT_UPDATES, WEATHER_PREWARM,
+    METRICS_HOST, METRICS_PORT, METRICS_REFRESH_INTERVAL, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_REUSE_PORT,
+    check_required_settings,
 )
+from user_data import flush_user_data_async, close_user_data, init_user_data, USER_DATA_FLUSH_INTERVAL
+from message_utils import dispatcher
+from weather import city_ids, weather_cache, owm_budget
+from scheduler import BroadcastScheduler, broadcasts
+from currency import refresh_currency_rates, currency_cache, oxr_budget, SNAPSHOT_KEY
+from forecast import refresh_forecasts
+from city_index import city_index
+from http_client import init_http_session, close_http_session
+from profiles import PROFILES, parse_profiles
+from inbound import setup_inbound
+from webhook import run_webhook
+from metrics import Gauge, start_metrics_server, startup_step, startup_timings
+
+startup_timings['import'] = time.perf_counter() - _import_started
 logger = logging.getLogger(__name__)
 
-async def start(update: Update, context):
-    try:
-        user_id = update.effective_user.id
-        logger.info(f"Команда /start получена от пользователя {user_id}")
-        save_user_data(user_id, city=None)
-        await send_message_with_retries(context.bot, update.effective_chat.id, "Привет! Я бот для получения погоды и курса гривны. Просто выберите нужную опцию. 😃")
-        await show_menu(update, context)
-    except Exception as e:
-        logger.error(f"Ошибка в функции start: {e}")
-        await send_message_with_retries(context.bot, update.effective_chat.id, "Произошла ошибка. Попробуйте снова позже.")
-    schedule_auto_update(context, update.effective_chat.id)
-
-async def save_city(update: Update, context):
-    if context.user_data.get('waiting_for_city'):
-        city = update.message.text
-        user_id = update.effective_user.id
-        save_user_data(user_id, city)
-        context.user_data['waiting_for_city'] = False
-        await send_message_with_retries(context.bot, update.effective_chat.id, f"Город {city} сохранен для пользователя {user_id}.")
-        weather_info = await get_weather(city)
-        await send_message_with_retries(context.bot, update.effective_chat.id, weather_info)
-        await show_menu(update, context)
+# Приложения ботов этого процесса; кэши, HTTP-сессия, хранилище и очередь
+# исходящих сообщений у них общие
+_applications = []
+_running = 0
+_metrics_runner = None
+# Номер процесса при запуске через workers.py; каждый процесс отдаёт метрики на своём порту
+_worker_index = 0
+
+async def flush_user_data_job(context: CallbackContext):
+    await flush_user_data_async()
+
+# Кэши с копией на диске: записываются пакетом и синхронизируются между процессами
+_persistent_caches = (city_ids, weather_cache, currency_cache)
+
+async def sync_caches_job(context: CallbackContext):
+    for cache in _persistent_caches:
+        await cache.sync()
+
+# Как часто проверяется возраст снимка курсов
+CURRENCY_CHECK_INTERVAL = CURRENCY_REFRESH_INTERVAL / 4
+
+async def refresh_currency_job(context: CallbackContext):
+    # При общем состоянии курсы запрашивает только лидер рассылки, остальные процессы
+    # берут снимок из общего постоянного кэша. Снимок обновляется заранее, если до
+    # следующей проверки он устареет; снимок, загруженный с диска после перезапуска,
+    # повторно не запрашивается, пока остаётся свежим.
+    if not context.job.data.is_leader:
+        return
+    age = currency_cache.age(SNAPSHOT_KEY)
+    if age is not None and age < CURRENCY_REFRESH_INTERVAL - CURRENCY_CHECK_INTERVAL:
+        return
+    await refresh_currency_rates(context)
+
+async def update_budget_metrics_job(context: CallbackContext):
+    # Остатки квот читаются здесь, а не при каждом сборе метрик
+    for budget in (owm_budget, oxr_budget):
+        await budget.update_remaining()
+
+def register_gauges():
+    schedulers = [application.bot_data['broadcasts'] for application in _applications]
+    Gauge('bot_outbound_queue_depth', 'Сообщения в очереди на отправку', lambda: dispatcher.queue_size)
+    Gauge('bot_active_jobs', 'Активные задачи планировщика', lambda: sum(len(application.job_queue.jobs()) for application in _applications))
+    Gauge('bot_broadcast_subscribers', 'Подписчики рассылки погоды', lambda: sum(scheduler.subscriber_count for scheduler in schedulers))
+    Gauge('bot_broadcast_cities', 'Города в рассылке погоды', lambda: sum(scheduler.city_count for scheduler in schedulers))
+    Gauge('bot_startup_seconds', 'Длительность запуска процесса', lambda: sum(startup_timings.values()))
+    Gauge('bot_upstream_budget_remaining', 'Оставшиеся вызовы внешних API в окне квоты',
+          lambda: {**owm_budget.remaining(), **oxr_budget.remaining()}, labels=('upstream', 'window'))
+
+async def start_shared(application: Application):
+    # Общие ресурсы открываются при запуске первого бота, а не при импорте модулей
+    global _metrics_runner
+    with startup_step('http'):
+        await init_http_session()
+    if METRICS_PORT:
+        with startup_step('metrics'):
+            register_gauges()
+            _metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT + _worker_index)
+    with startup_step('storage'):
+        await init_user_data()
+        loop = asyncio.get_running_loop()
+        for cache in _persistent_caches:
+            await loop.run_in_executor(None, cache.open)
+            await cache.sync()
+        await loop.run_in_executor(None, city_index.load)
+    with startup_step('jobs'):
+        application.job_queue.run_repeating(flush_user_data_job, interval=USER_DATA_FLUSH_INTERVAL, first=USER_DATA_FLUSH_INTERVAL)
+        application.job_queue.run_repeating(sync_caches_job, interval=CACHE_SYNC_INTERVAL, first=CACHE_SYNC_INTERVAL)
+        # Курсы валют нужны только боту с меню
+        if any(app.bot_data['profile'] == 'menu' for app in _applications):
+            application.job_queue.run_repeating(refresh_currency_job, interval=CURRENCY_CHECK_INTERVAL, first=0,
+                                                data=application.bot_data['broadcasts'])
+        application.job_queue.run_repeating(refresh_forecasts, interval=FORECAST_REFRESH_INTERVAL, first=FORECAST_REFRESH_INTERVAL)
+        if METRICS_PORT:
+            application.job_queue.run_repeating(update_budget_metrics_job, interval=METRICS_REFRESH_INTERVAL, first=0)
+
+async def close_shared():
+    global _metrics_runner
+    await dispatcher.stop()
+    close_user_data()
+    for cache in _persistent_caches:
+        cache.close()
+    await close_http_session()
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+        _metrics_runner = None
+
+async def on_startup(application: Application):
+    global _running
+    if _running == 0:
+        await start_shared(application)
+    _running += 1
+    scheduler = application.bot_data['broadcasts']
+    with startup_step(scheduler.lease):
+        await scheduler.restore()
+        scheduler.start(application.job_queue)
+    if WEATHER_PREWARM:
+        application.create_task(scheduler.prewarm())
+    logger.info("Время запуска: %s", ', '.join(f"{step} {seconds:.3f} с" for step, seconds in startup_timings.items()))
+
+async def on_shutdown(application: Application):
+    global _running
+    application.bot_data['broadcasts'].stop()
+    _running -= 1
+    if _running == 0:
+        await close_shared()
+
+def build_application(profile='menu', locale='ru', token=None, base_url=None, name=''):
+    # name различает ботов одного процесса; основной бот (name='') использует общий объект рассылки
+    required = ["WEATHER_API_KEY"]
+    if not token:
+        required.append("TELEGRAM_TOKEN")
+    if profile == 'menu':
+        required.append("CURRENCY_API_KEY")
+    check_required_settings(required)
+    started = time.perf_counter()
+    builder = (
+        Application.builder()
+        .token(token or TELEGRAM_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+    application.bot_data['name'] = name
+    application.bot_data['profile'] = profile
+    application.bot_data['locale'] = locale
+    if name:
+        application.bot_data['broadcasts'] = BroadcastScheduler(name, locale)
     else:
-        await button(update, context)
-    schedule_auto_update(context, update.effective_chat.id)
-
-async def auto_update(context: CallbackContext):
-    job = context.job
-    city = job.data.get('city')
-    chat_id = job.data.get('chat_id')
-    if city:
-        weather_info = await get_weather(city)
-        await send_message_with_retries(context.bot, chat_id, weather_info)
-
-def schedule_auto_update(context: CallbackContext, chat_id):
-    job_queue = context.job_queue
-    user_data = load_user_data(chat_id)
-    city = user_data.get('city') if user_data else None
-    if city:
-        job_queue.run_repeating(auto_update, interval=7200, first=7200, data={'chat_id': chat_id, 'city': city})
-
-def main():
+        broadcasts.locale = locale
+        application.bot_data['broadcasts'] = broadcasts
+
+    logger.info("Профиль бота: %s (%s)", profile, locale)
+    setup_inbound(application)
+    PROFILES[profile](application)
+    _applications.append(application)
+    startup_timings['build'] = startup_timings.get('build', 0) + time.perf_counter() - started
+    return application
+
+def build_applications(spec=BOT_PROFILES):
+    applications = []
+    for index, (profile, locale, token_var) in enumerate(parse_profiles(spec)):
+        if index > 0 and not token_var:
+            raise ValueError(f"Для профиля {profile}:{locale} не указана переменная с токеном бота (профиль@ПЕРЕМЕННАЯ).")
+        token = os.getenv(token_var) if token_var else None
+        if token_var and not token:
+            raise ValueError(f"{token_var} отсутствует. Укажите токен бота для профиля {profile}:{locale}.")
+        name = token_var.lower() if index > 0 else ''
+        applications.append(build_application(profile, locale, token, name=name))
+    return applications
+
+async def _poll(applications):
+    # Опрос нескольких ботов в одном цикле событий
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    started = []
+    try:
+        for application in applications:
+            await application.initialize()
+            started.append(application)
+            if application.post_init:
+                await application.post_init(application)
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            await application.start()
+        await stop.wait()
+    finally:
+        for application in reversed(started):
+            if application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+def main(worker_index=0):
+    global _worker_index
+    _worker_index = worker_index
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
     logger.info("Запуск бота...")
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
-
-    logger.info("Добавление обработчика команды /start")
-    application.add_handler(CommandHandler("start", start))
-    
-    logger.info("Добавление обработчика команды /menu")
-    application.add_handler(CommandHandler("menu", show_menu))
-
-    logger.info("Добавление обработчика текстовых сообщений")
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, save_city))
-    
-    logger.info("Запуск опроса...")
-    application.run_polling()
+    applications = build_applications()
+
+    if BOT_MODE == 'webhook':
+        logger.info("Запуск в режиме webhook...")
+        run_webhook(applications, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_REUSE_PORT)
+    elif len(applications) == 1:
+        logger.info("Запуск опроса...")
+        applications[0].run_polling()
+    else:
+        logger.info("Запуск опроса для %d ботов...", len(applications))
+        asyncio.run(_poll(applications))
 
 if __name__ == "__main__":
     main()
@@ -1,18 +1,188 @@
+import time
+import random
 import logging
 import asyncio
-from telegram.error import TimedOut
+import itertools
+import contextvars
+from config import OUTBOUND_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST
+from metrics import outbound_retries
 
 logger = logging.getLogger(__name__)
 
-async def send_message_with_retries(bot, chat_id, text, retries=3, delay=5):
-    for attempt in range(retries):
+# Интерактивные ответы отправляются раньше плановых рассылок
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BROADCAST = 1
+
+MAX_IDLE_CHAT_BUCKETS = 10000
+
+# Интерактивные ответы на текущее обновление: (chat_id, текст, параметры отправки)
+_replies = contextvars.ContextVar('replies', default=None)
+
+def capture_replies(enabled=True):
+    # Ответы, отправленные при обработке текущего обновления, собираются в возвращаемый список
+    replies = [] if enabled else None
+    _replies.set(replies)
+    return replies
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, timer=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._timer = timer
+        self._tokens = self.capacity
+        self._updated = timer()
+
+    def _refill(self):
+        now = self._timer()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, tokens=1):
+        # Возвращает 0, если токены списаны, иначе время ожидания в секундах
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    @property
+    def full(self):
+        self._refill()
+        return self._tokens >= self.capacity
+
+class MessageDispatcher:
+    # Общая очередь исходящих сообщений с ограничением скорости (глобально и на чат)
+    def __init__(self, rate=OUTBOUND_RATE, chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(rate)
+        self._chats = {}
+        self._seq = itertools.count()
+        self._queue = None
+        self._task = None
+        self._sending = set()
+        self._delayed = 0
+        self._paused_until = 0.0
+        self.retry_count = 0
+
+    @property
+    def queue_size(self):
+        return (self._queue.qsize() if self._queue is not None else 0) + self._delayed + len(self._sending)
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.PriorityQueue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    async def send(self, bot, chat_id, text, priority=PRIORITY_INTERACTIVE, retries=3, delay=5, **kwargs):
+        self.start()
+        item = {
+            'bot': bot,
+            'chat_id': chat_id,
+            'text': text,
+            'kwargs': kwargs,
+            'future': asyncio.get_running_loop().create_future(),
+            'attempt': 0,
+            'retries': retries,
+            'delay': delay,
+        }
+        self._put(priority, item)
+        return await item['future']
+
+    def _put(self, priority, item):
+        self._queue.put_nowait((priority, next(self._seq), item))
+
+    def _put_later(self, delay, priority, item):
+        def put():
+            self._delayed -= 1
+            self._put(priority, item)
+        self._delayed += 1
+        asyncio.get_running_loop().call_later(delay, put)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_IDLE_CHAT_BUCKETS:
+                # Полные корзины ничем не отличаются от новых, их можно выбросить
+                self._chats = {key: value for key, value in self._chats.items() if not value.full}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _run(self):
+        while True:
+            priority, _, item = await self._queue.get()
+            if item['future'].done():
+                continue
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            wait = self._chat_bucket(item['chat_id']).consume()
+            if wait > 0:
+                self._put_later(wait, priority, item)
+                continue
+            wait = self._global.consume()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._global.consume()
+            task = asyncio.create_task(self._send(priority, item))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, priority, item):
+        # Импорт telegram откладывается до первой отправки сообщения
+        from telegram.error import BadRequest, NetworkError, RetryAfter
+        future = item['future']
+        chat_id = item['chat_id']
         try:
-            await bot.send_message(chat_id, text=text)
-            logger.info(f"Сообщение успешно отправлено на попытке {attempt + 1}.")
+            message = await item['bot'].send_message(chat_id, text=item['text'], **item['kwargs'])
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            logger.warning("Превышен лимит Telegram, повтор через %s с (чат %s).", retry_after, chat_id)
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._retry(priority, item, retry_after + random.uniform(0, 1))
+        except BadRequest as e:
+            # BadRequest наследует NetworkError, но повтор не поможет (чат не найден, слишком длинный текст)
+            logger.error("Telegram отклонил сообщение в чат %s: %s", chat_id, e)
+            if not future.done():
+                future.set_exception(e)
+        except NetworkError as e:
+            logger.error("Ошибка сети при отправке сообщения в чат %s: %s. Попытка %d из %d.", chat_id, e, item['attempt'] + 1, item['retries'])
+            backoff = item['delay'] * 2 ** item['attempt']
+            self._retry(priority, item, backoff * random.uniform(0.5, 1.5))
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            logger.debug("Сообщение отправлено в чат %s на попытке %d.", chat_id, item['attempt'] + 1)
+            if not future.done():
+                future.set_result(message)
+
+    def _retry(self, priority, item, delay):
+        item['attempt'] += 1
+        if item['attempt'] >= item['retries']:
+            logger.error("Не удалось отправить сообщение в чат %s после нескольких попыток.", item['chat_id'])
+            if not item['future'].done():
+                item['future'].set_result(None)
             return
-        except TimedOut:
-            logger.error(f"Ошибка таймаута при отправке сообщения в чат {chat_id}. Попытка {attempt + 1} из {retries}.")
-            if attempt < retries - 1:
-                await asyncio.sleep(delay)
-            else:
-                logger.error(f"Не удалось отправить сообщение в чат {chat_id} после нескольких попыток.")
+        self.retry_count += 1
+        outbound_retries.inc()
+        self._put_later(delay, priority, item)
+
+dispatcher = MessageDispatcher()
+
+async def send_message_with_retries(bot, chat_id, text, retries=3, delay=5, priority=PRIORITY_INTERACTIVE, **kwargs):
+    replies = _replies.get()
+    if replies is not None and priority == PRIORITY_INTERACTIVE:
+        replies.append((chat_id, text, kwargs))
+    return await dispatcher.send(bot, chat_id, text, priority=priority, retries=retries, delay=delay, **kwargs)
@@ -0,0 +1,151 @@
+import time
+import bisect
+import logging
+import functools
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+_registry = []
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def collect(self):
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+class Gauge:
+    # Значение берётся из функции в момент сбора метрик;
+    # с метками функция возвращает {значения меток: значение}
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, func=None, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.labels = labels
+        _registry.append(self)
+
+    def collect(self):
+        if self.func is None:
+            return
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.error("Ошибка вычисления метрики %s: %s", self.name, e)
+            return
+        if not self.labels:
+            yield f"{self.name} {value}"
+            return
+        for label_values, series_value in value.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {series_value}"
+
+class Histogram:
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # значения меток -> [счётчики корзин, сумма, количество]
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def collect(self):
+        for label_values, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labels, label_values, [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {count}"
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+handler_latency = Histogram('bot_handler_latency_seconds', 'Время обработки обновления', labels=('handler',))
+handler_errors = Counter('bot_handler_errors_total', 'Необработанные ошибки в обработчиках', labels=('handler',))
+cache_requests = Counter('bot_cache_requests_total', 'Обращения к кэшам', labels=('cache', 'result'))
+inbound_rejected = Counter('bot_inbound_rejected_total', 'Входящие обновления, отклонённые до обработчиков', labels=('reason',))
+upstream_latency = Histogram('bot_upstream_latency_seconds', 'Время ответа внешних API', labels=('upstream',))
+upstream_errors = Counter('bot_upstream_errors_total', 'Ошибки внешних API', labels=('upstream',))
+outbound_retries = Counter('bot_outbound_retries_total', 'Повторные попытки отправки сообщений')
+upstream_budget_rejections = Counter('bot_upstream_budget_rejections_total', 'Запросы к внешним API, отклонённые из-за квоты', labels=('upstream', 'priority'))
+
+# Этап запуска процесса -> длительность в секундах
+startup_timings = {}
+
+@contextlib.contextmanager
+def startup_step(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - started
+
+def timed_handler(name):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                handler_errors.inc(name)
+                raise
+            finally:
+                handler_latency.observe(time.perf_counter() - started, name)
+        return wrapper
+    return decorator
+
+async def start_metrics_server(host, port):
+    # aiohttp.web нужен только при включённом эндпоинте метрик
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,162 @@
+import logging
+from telegram import Update
+from telegram.ext import CommandHandler, MessageHandler, filters, CallbackContext
+from config import BROADCAST_INTERVAL
+from user_data import save_user_data_async, load_user_data_async, update_user_data_async
+from buttons import show_menu, button, send_forecast
+from message_utils import send_message_with_retries
+from weather import get_weather, get_weather_by_location, resolve_city
+from render import message
+from utils import get_locale, request_city
+from alerts import parse_alert_settings
+from metrics import timed_handler
+
+logger = logging.getLogger(__name__)
+
+# Профиль бота: набор обработчиков. Язык задаётся отдельно и хранится в bot_data['locale'].
+# menu - бот с кнопками (погода, прогноз, курс гривны), бывший main.py;
+# simple - бот, который отвечает погодой на любое название города и подписывает
+# на рассылку, бывшие weather_bot.py (ru) и weather_bot_final.py (uk).
+
+@timed_handler('start')
+async def start(update: Update, context):
+    locale = get_locale(context)
+    try:
+        user_id = update.effective_user.id
+        logger.info("Команда /start получена от пользователя %s", user_id)
+        await save_user_data_async(user_id, city=None)
+        await send_message_with_retries(context.bot, update.effective_chat.id, message('greeting_menu', locale))
+        await show_menu(update, context)
+    except Exception as e:
+        logger.error("Ошибка в функции start: %s", e)
+        await send_message_with_retries(context.bot, update.effective_chat.id, message('error', locale))
+    await schedule_auto_update(context, update.effective_chat.id)
+
+@timed_handler('save_city')
+async def save_city(update: Update, context):
+    if context.user_data.get('waiting_for_city'):
+        locale = get_locale(context)
+        # Название из локального индекса, если введённое распознано
+        _, _, city = resolve_city(update.message.text)
+        user_id = update.effective_user.id
+        await save_user_data_async(user_id, city)
+        context.user_data['waiting_for_city'] = False
+        await send_message_with_retries(context.bot, update.effective_chat.id, message('city_saved', locale, city=city, user_id=user_id))
+        weather_info = await get_weather(city, locale)
+        await send_message_with_retries(context.bot, update.effective_chat.id, weather_info)
+        await show_menu(update, context)
+    else:
+        await button(update, context)
+    await schedule_auto_update(context, update.effective_chat.id)
+
+@timed_handler('save_location')
+async def save_location(update: Update, context):
+    location = update.message.location
+    user_id = update.effective_user.id
+    logger.info("Получена геолокация от пользователя %s", user_id)
+    city, weather_info = await get_weather_by_location(location.latitude, location.longitude, get_locale(context))
+    if city:
+        await save_user_data_async(user_id, city)
+        context.user_data['waiting_for_city'] = False
+    await send_message_with_retries(context.bot, update.effective_chat.id, weather_info)
+    if context.bot_data.get('profile') == 'menu':
+        await show_menu(update, context)
+    await schedule_auto_update(context, update.effective_chat.id)
+
+@timed_handler('start')
+async def start_simple(update: Update, context):
+    logger.info("Команда /start получена от пользователя %s", update.effective_user.id)
+    await send_message_with_retries(context.bot, update.effective_chat.id, message('greeting_simple', get_locale(context)))
+
+@timed_handler('weather_text')
+async def weather_text(update: Update, context):
+    locale = get_locale(context)
+    user_id = update.effective_user.id
+    logger.info("Получено сообщение от пользователя %s", user_id)
+    _, _, city = resolve_city(update.message.text)
+    await save_user_data_async(user_id, city)
+    weather_info = await get_weather(city, locale)
+    await send_message_with_retries(context.bot, update.effective_chat.id, weather_info)
+    await send_message_with_retries(context.bot, update.effective_chat.id, message('next_update', locale, hours=round(BROADCAST_INTERVAL / 3600)))
+    await schedule_auto_update(context, update.effective_chat.id)
+
+@timed_handler('alerts')
+async def alerts(update: Update, context):
+    # Включение оповещений об изменении погоды вместо рассылки по расписанию
+    locale = get_locale(context)
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+    try:
+        settings = parse_alert_settings(context.args or ())
+    except ValueError as e:
+        logger.info("Неверные параметры /alerts от пользователя %s: %s", user_id, e)
+        await send_message_with_retries(context.bot, chat_id, message('alerts_usage', locale))
+        return
+    profile = await update_user_data_async(user_id, **{context.bot_data['broadcasts'].alerts_flag: settings})
+    if settings is None:
+        text = message('alerts_off', locale, hours=round(BROADCAST_INTERVAL / 3600))
+    else:
+        text = message('alerts_on', locale, temp=settings['temp'], pressure=settings['pressure'])
+        if settings['precip']:
+            text += ' ' + message('alerts_precip', locale)
+    await send_message_with_retries(context.bot, chat_id, text)
+    if profile and profile.get('city'):
+        await context.bot_data['broadcasts'].register(chat_id, profile)
+    else:
+        await request_city(update, context)
+
+async def schedule_auto_update(context: CallbackContext, chat_id):
+    user_data = await load_user_data_async(chat_id)
+    await context.bot_data['broadcasts'].register(chat_id, user_data)
+
+def setup_menu(application):
+    logger.info("Добавление обработчика команды /start")
+    application.add_handler(CommandHandler("start", start))
+
+    logger.info("Добавление обработчика команды /menu")
+    application.add_handler(CommandHandler("menu", show_menu))
+
+    logger.info("Добавление обработчика команды /forecast")
+    application.add_handler(CommandHandler("forecast", timed_handler('forecast')(send_forecast)))
+
+    logger.info("Добавление обработчика команды /alerts")
+    application.add_handler(CommandHandler("alerts", alerts))
+
+    logger.info("Добавление обработчика текстовых сообщений")
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, save_city))
+
+    logger.info("Добавление обработчика геолокации")
+    application.add_handler(MessageHandler(filters.LOCATION, save_location))
+
+def setup_simple(application):
+    application.add_handler(CommandHandler("start", start_simple))
+    application.add_handler(CommandHandler("forecast", timed_handler('forecast')(send_forecast)))
+    application.add_handler(CommandHandler("alerts", alerts))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, weather_text))
+    application.add_handler(MessageHandler(filters.LOCATION, save_location))
+
+PROFILES = {
+    'menu': setup_menu,
+    'simple': setup_simple,
+}
+LOCALES = ('ru', 'uk')
+
+def parse_profiles(spec):
+    # "профиль[:язык][@ПЕРЕМЕННАЯ_С_ТОКЕНОМ]" через запятую, например
+    # "menu:ru,simple:uk@TELEGRAM_TOKEN_UK"; первый бот по умолчанию использует TELEGRAM_TOKEN
+    entries = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        item, _, token_var = item.partition('@')
+        profile, _, locale = item.partition(':')
+        locale = locale or 'ru'
+        if profile not in PROFILES:
+            raise ValueError(f"Неизвестный профиль бота: {profile}. Доступны: {', '.join(PROFILES)}")
+        if locale not in LOCALES:
+            raise ValueError(f"Неизвестный язык профиля: {locale}. Доступны: {', '.join(LOCALES)}")
+        entries.append((profile, locale, token_var or None))
+    if not entries:
+        raise ValueError("BOT_PROFILES не содержит ни одного профиля.")
+    return entries
@@ -0,0 +1,215 @@
+import logging
+from datetime import datetime, timezone
+from cachetools import LRUCache
+from config import RENDER_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+weather_emojis = {
+    'ru': {
+        "ясно": "☀️",
+        "переменная облачность": "⛅️",
+        "облачно с прояснениями": "🌤",
+        "облачно": "☁️",
+        "пасмурно": "☁️",
+        "дождь": "🌧",
+        "гроза": "⛈",
+        "снег": "❄️",
+        "туман": "🌫"
+    },
+    'uk': {
+        "ясно": "☀️",
+        "перемінна хмарність": "⛅️",
+        "хмарно з проясненнями": "🌤",
+        "хмарно": "☁️",
+        "пасмурно": "☁️",
+        "дощ": "🌧",
+        "гроза": "⛈",
+        "сніг": "❄️",
+        "туман": "🌫"
+    },
+}
+
+currency_emojis = {
+    "USD": "🇺🇸",  # Флаг США
+    "EUR": "🇪🇺",  # Флаг Европейского Союза
+    "GBP": "🇬🇧",  # Флаг Великобритании
+    "JPY": "🇯🇵",  # Флаг Японии
+    "RUB": "🇷🇺"   # Флаг России
+}
+
+CURRENCIES = ("USD", "EUR", "GBP", "JPY", "RUB")
+
+def get_weather_emoji(description, locale='ru'):
+    emojis = weather_emojis[locale]
+    for key in emojis:
+        if key in description:
+            return emojis[key]
+    return ""
+
+def _weather_ru(data, city):
+    weather = data['weather'][0]['description']
+    main = data['main']
+    return (
+        f"Погода в {city}:\n"
+        f"Описание: {weather} {get_weather_emoji(weather, 'ru')}\n"
+        f"Температура: {main['temp']}°C 🌡️\n"
+        f"Ощущается как: {main['feels_like']}°C 🌡️\n"
+        f"Влажность: {main['humidity']}% 💧\n"
+        f"Давление: {main['pressure']} hPa 🌬️\n"
+        f"😃"
+    )
+
+def _weather_uk(data, city):
+    weather = data['weather'][0]['description']
+    main = data['main']
+    return (
+        f"Погода в {city}:\n"
+        f"Опис: {weather} {get_weather_emoji(weather, 'uk')}\n"
+        f"Температура: {main['temp']}°C 🌡️\n"
+        f"Відчувається як: {main['feels_like']}°C 🌡️\n"
+        f"Вологість: {main['humidity']}% 💧\n"
+        f"Тиск: {main['pressure']} hPa 🌬️\n"
+        f"😃"
+    )
+
+def _uah_rates(rates):
+    uah_rate = rates['UAH']
+    return {code: 1 / rates[code] * uah_rate for code in CURRENCIES}
+
+def _currency(title, stale_note):
+    def render_currency_template(snapshot, fresh):
+        lines = [title]
+        lines += [f"{code}: {rate:.2f} {currency_emojis[code]}" for code, rate in _uah_rates(snapshot['rates']).items()]
+        text = '\n'.join(lines) + '\n'
+        if not fresh:
+            updated_at = datetime.fromtimestamp(snapshot['timestamp'], tz=timezone.utc)
+            text += f"{stale_note} {updated_at:%d.%m.%Y %H:%M} UTC\n"
+        return text
+    return render_currency_template
+
+WEEKDAYS = {
+    'ru': ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"),
+    'uk': ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Нд"),
+}
+
+def _forecast(title, precip_label, locale):
+    def render_forecast_template(series, city):
+        lines = [f"{title} {city}:"]
+        for day, low, high, precip, pop, description in series.daily():
+            date = datetime.fromtimestamp(day, tz=timezone.utc)
+            line = f"{WEEKDAYS[locale][date.weekday()]} {date:%d.%m}: {low:+.0f}…{high:+.0f}°C, {description} {get_weather_emoji(description, locale)}"
+            if precip >= 0.1:
+                line += f", {precip_label} {precip:.1f} мм ({pop:.0%})"
+            lines.append(line)
+        return '\n'.join(lines) + '\n'
+    return render_forecast_template
+
+TEMPLATES = {
+    ('weather', 'ru'): _weather_ru,
+    ('weather', 'uk'): _weather_uk,
+    ('currency', 'ru'): _currency("Курс гривны (UAH):", "Данные на"),
+    ('currency', 'uk'): _currency("Курс гривні (UAH):", "Дані на"),
+    ('forecast', 'ru'): _forecast("Прогноз погоды в", "осадки", 'ru'),
+    ('forecast', 'uk'): _forecast("Прогноз погоди в", "опади", 'uk'),
+}
+
+# Тексты сообщений бота по языкам профиля
+MESSAGES = {
+    'ru': {
+        'greeting_menu': "Привет! Я бот для получения погоды и курса гривны. Просто выберите нужную опцию. 😃",
+        'greeting_simple': "Привет! Я бот для получения погоды. Просто введи название города на украинском языке, чтобы узнать погоду. 😃",
+        'error': "Произошла ошибка. Попробуйте снова позже.",
+        'city_saved': "Город {city} сохранен для пользователя {user_id}.",
+        'next_update': "Следующее обновление прогноза через {hours} ч. 🌦️",
+        'choose_option': "Выберите опцию:",
+        'ask_city': "Пожалуйста, введите название города или отправьте геолокацию:",
+        'send_location': "📍 Отправить геолокацию",
+        'button_weather': "Погода",
+        'button_forecast': "Прогноз",
+        'button_currency': "Курс гривны",
+        'empty_city': "Название города не может быть пустым.",
+        'city_not_found': "Город не найден. Проверьте правильность ввода.",
+        'city_suggestion': "Город не найден. Возможно, вы имели в виду {city}?",
+        'weather_unavailable': "Сервис погоды временно недоступен. Попробуйте снова позже.",
+        'weather_quota': "Лимит запросов к сервису погоды исчерпан. Попробуйте снова позже.",
+        'weather_failed': "Не удалось получить данные о погоде.",
+        'weather_error': "Произошла ошибка при получении данных о погоде. Попробуйте снова позже.",
+        'currency_unavailable': "Сервис курсов валют временно недоступен. Попробуйте снова позже.",
+        'currency_quota': "Лимит запросов к сервису курсов валют исчерпан. Попробуйте снова позже.",
+        'currency_failed': "Не удалось получить данные о курсах валют.",
+        'currency_error': "Произошла ошибка при получении данных о курсах валют. Попробуйте снова позже.",
+        'alerts_on': "Оповещения включены: сообщу, когда температура изменится на {temp:g}°C или давление упадёт на {pressure:g} hPa.",
+        'alerts_precip': "Также сообщу о начале дождя или снега.",
+        'alerts_off': "Оповещения выключены. Погода будет приходить каждые {hours} ч.",
+        'alerts_usage': "Использование: /alerts [temp=3] [pressure=5] [precip=on|off] или /alerts off",
+        'alert_temp': "🌡️ Температура изменилась на {value:+.1f}°C",
+        'alert_rain': "🌧️ Начался дождь",
+        'alert_snow': "❄️ Начался снег",
+        'alert_pressure': "📉 Давление упало на {value:g} hPa",
+    },
+    'uk': {
+        'greeting_menu': "Привіт! Я бот для отримання погоди та курсу гривні. Просто оберіть потрібну опцію. 😃",
+        'greeting_simple': "Привіт! Я бот для отримання погоди. Просто введи назву міста українською мовою, щоб дізнатися погоду. 😃",
+        'error': "Сталася помилка. Спробуйте знову пізніше.",
+        'city_saved': "Місто {city} збережено для користувача {user_id}.",
+        'next_update': "Наступне оновлення прогнозу через {hours} год. 🌦️",
+        'choose_option': "Оберіть опцію:",
+        'ask_city': "Будь ласка, введіть назву міста або надішліть геолокацію:",
+        'send_location': "📍 Надіслати геолокацію",
+        'button_weather': "Погода",
+        'button_forecast': "Прогноз",
+        'button_currency': "Курс гривні",
+        'empty_city': "Назва міста не може бути порожньою.",
+        'city_not_found': "Місто не знайдено. Перевірте правильність вводу.",
+        'city_suggestion': "Місто не знайдено. Можливо, ви мали на увазі {city}?",
+        'weather_unavailable': "Сервіс погоди тимчасово недоступний. Спробуйте знову пізніше.",
+        'weather_quota': "Ліміт запитів до сервісу погоди вичерпано. Спробуйте знову пізніше.",
+        'weather_failed': "Не вдалося отримати дані про погоду.",
+        'weather_error': "Сталася помилка при отриманні даних про погоду. Спробуйте знову пізніше.",
+        'currency_unavailable': "Сервіс курсів валют тимчасово недоступний. Спробуйте знову пізніше.",
+        'currency_quota': "Ліміт запитів до сервісу курсів валют вичерпано. Спробуйте знову пізніше.",
+        'currency_failed': "Не вдалося отримати дані про курси валют.",
+        'currency_error': "Сталася помилка при отриманні даних про курси валют. Спробуйте знову пізніше.",
+        'alerts_on': "Сповіщення увімкнено: повідомлю, коли температура зміниться на {temp:g}°C або тиск впаде на {pressure:g} hPa.",
+        'alerts_precip': "Також повідомлю про початок дощу або снігу.",
+        'alerts_off': "Сповіщення вимкнено. Погода надходитиме кожні {hours} год.",
+        'alerts_usage': "Використання: /alerts [temp=3] [pressure=5] [precip=on|off] або /alerts off",
+        'alert_temp': "🌡️ Температура змінилася на {value:+.1f}°C",
+        'alert_rain': "🌧️ Почався дощ",
+        'alert_snow': "❄️ Почався сніг",
+        'alert_pressure': "📉 Тиск впав на {value:g} hPa",
+    },
+}
+
+def message(key, locale='ru', **kwargs):
+    text = MESSAGES[locale][key]
+    return text.format(**kwargs) if kwargs else text
+
+# (шаблон, язык, версия данных, параметры) -> готовый текст
+_rendered = LRUCache(maxsize=RENDER_CACHE_SIZE)
+
+def render(template, locale, version, data, *args):
+    # Текст пересобирается только при смене версии данных
+    key = (template, locale, version) + args
+    text = _rendered.get(key)
+    if text is None:
+        text = _rendered[key] = TEMPLATES[(template, locale)](data, *args)
+    return text
+
+def render_weather(data, city, locale='ru'):
+    # Версия наблюдения OpenWeatherMap: id города и время измерения
+    return render('weather', locale, (data['id'], data.get('dt')), data, city)
+
+def render_alert(data, city, changes, locale='ru'):
+    # Причины оповещения из alerts.detect_changes и текущая погода
+    lines = [message(f'alert_{kind}', locale, value=value) if value is not None else message(f'alert_{kind}', locale)
+             for kind, value in changes]
+    return '\n'.join(lines) + '\n\n' + render_weather(data, city, locale)
+
+def render_currency(snapshot, fresh=True, locale='ru'):
+    return render('currency', locale, snapshot['timestamp'], snapshot, fresh)
+
+def render_forecast(series, city, locale='ru'):
+    # Версия прогноза: id города и время его загрузки
+    return render('forecast', locale, (series.city_id, series.fetched_at), series, city)
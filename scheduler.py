@@ -0,0 +1,206 @@
+import zlib
+import random
+import asyncio
+import logging
+from config import BROADCAST_INTERVAL, BROADCAST_SLOTS, ALERT_CHECK_INTERVAL
+from weather import get_weather_many, normalize_city
+from render import render_weather, render_alert
+from message_utils import send_message_with_retries, PRIORITY_BROADCAST
+from budget import PRIORITY_BACKGROUND
+from user_data import read_user_data_async, update_user_data_async
+from backend import backend, LEADER_LEASE_TTL
+from alerts import observe, detect_changes, next_baseline, settings_key
+
+logger = logging.getLogger(__name__)
+
+class BroadcastScheduler:
+    # Подписчики группируются по городу, города распределяются по слотам.
+    # В каждом слоте погода для города запрашивается один раз и рассылается всем его подписчикам.
+    # Подписчики в режиме оповещений получают погоду, только когда она заметно изменилась:
+    # проверка выполняется раз на город для каждого набора порогов.
+    # name различает рассылки нескольких ботов в одном процессе; у основного бота он пустой
+    def __init__(self, name='', locale='ru', interval=BROADCAST_INTERVAL, slots=BROADCAST_SLOTS, alert_interval=ALERT_CHECK_INTERVAL):
+        self.name = name
+        self.locale = locale
+        # Признаки подписки и оповещений в профиле пользователя и имя аренды лидера для этой рассылки
+        self.flag = f"auto_update_{name}" if name else 'auto_update'
+        self.alerts_flag = f"alerts_{name}" if name else 'alerts'
+        self.lease = f"broadcasts-{name}" if name else 'broadcasts'
+        self.interval = interval
+        self.alert_interval = alert_interval
+        self.slots = max(1, slots)
+        # нормализованный город -> {'city': название, 'chats': set(chat_id), 'alerts': {chat_id: пороги}}
+        self._groups = {}
+        self._chat_cities = {}  # chat_id -> нормализованный город
+        # нормализованный город -> {ключ порогов: последнее отправленное наблюдение};
+        # хранится в памяти, после перезапуска первая проверка только запоминает наблюдение
+        self._observations = {}
+        self._jobs = []
+        # При общем состоянии рассылку ведёт только процесс-лидер
+        self.is_leader = not backend.shared
+
+    def slot_for(self, key):
+        return zlib.crc32(key.encode('utf-8')) % self.slots
+
+    def subscribe(self, chat_id, city, alerts=None):
+        # alerts - пороги оповещений; None - погода каждые interval секунд
+        key = normalize_city(city)
+        if self._chat_cities.get(chat_id) == key and self._groups[key]['alerts'].get(chat_id) == alerts:
+            return
+        self.unsubscribe(chat_id)
+        group = self._groups.setdefault(key, {'city': city, 'chats': set(), 'alerts': {}})
+        if alerts:
+            group['alerts'][chat_id] = alerts
+        else:
+            group['chats'].add(chat_id)
+        self._chat_cities[chat_id] = key
+        logger.info("Чат %s подписан на %s для %s (слот %d).", chat_id, "оповещения" if alerts else "рассылку погоды", key, self.slot_for(key))
+
+    def unsubscribe(self, chat_id):
+        key = self._chat_cities.pop(chat_id, None)
+        if key is None:
+            return False
+        group = self._groups[key]
+        group['chats'].discard(chat_id)
+        group['alerts'].pop(chat_id, None)
+        if not group['chats'] and not group['alerts']:
+            del self._groups[key]
+            self._observations.pop(key, None)
+        return True
+
+    async def register(self, chat_id, profile):
+        # Не более одной подписки на чат; признак подписки хранится в профиле пользователя
+        city = profile.get('city') if profile else None
+        if city:
+            self.subscribe(chat_id, city, profile.get(self.alerts_flag))
+            if not profile.get(self.flag):
+                await update_user_data_async(chat_id, **{self.flag: True})
+        else:
+            self.unsubscribe(chat_id)
+            if profile and profile.get(self.flag):
+                await update_user_data_async(chat_id, **{self.flag: False})
+
+    async def restore(self):
+        data = await read_user_data_async()
+        self._groups.clear()
+        self._chat_cities.clear()
+        for chat_id, profile in data.items():
+            if profile.get(self.flag) and profile.get('city'):
+                self.subscribe(int(chat_id), profile['city'], profile.get(self.alerts_flag))
+        logger.info("Восстановлено подписок на рассылку: %d (городов: %d).", self.subscriber_count, self.city_count)
+
+    def start(self, job_queue):
+        if backend.shared:
+            self._jobs.append(job_queue.run_repeating(self._renew_leadership, interval=LEADER_LEASE_TTL / 3, first=0, name=f"{self.lease}-leader"))
+        slot_length = self.interval / self.slots
+        for slot in range(self.slots):
+            # Случайный сдвиг внутри слота, чтобы после перезапуска рассылки не стартовали одновременно
+            self._jobs.append(job_queue.run_repeating(
+                self._run_slot,
+                interval=self.interval,
+                first=slot_length * slot + random.uniform(1, slot_length),
+                data=slot,
+                name=f"{self.lease}-{slot}",
+            ))
+        alert_slot_length = self.alert_interval / self.slots
+        for slot in range(self.slots):
+            self._jobs.append(job_queue.run_repeating(
+                self._run_alert_slot,
+                interval=self.alert_interval,
+                first=alert_slot_length * slot + random.uniform(1, alert_slot_length),
+                data=slot,
+                name=f"{self.lease}-alerts-{slot}",
+            ))
+
+    def stop(self):
+        for job in self._jobs:
+            job.schedule_removal()
+        self._jobs.clear()
+        if backend.shared and self.is_leader:
+            backend.release_leadership(self.lease)
+            self.is_leader = False
+
+    async def _renew_leadership(self, context):
+        is_leader = await asyncio.to_thread(backend.try_acquire_leadership, self.lease, LEADER_LEASE_TTL)
+        if is_leader != self.is_leader:
+            logger.info("Процесс %s %s лидером рассылки.", backend.worker_id, "стал" if is_leader else "перестал быть")
+        self.is_leader = is_leader
+
+    async def _run_slot(self, context):
+        if not self.is_leader:
+            return
+        if backend.shared:
+            # Подписки могли появиться в других процессах
+            await self.restore()
+        slot = context.job.data
+        groups = [(group['city'], set(group['chats'])) for key, group in self._groups.items() if group['chats'] and self.slot_for(key) == slot]
+        if not groups:
+            return
+        logger.info("Рассылка слота %d: %d городов, %d чатов.", slot, len(groups), sum(len(chats) for _, chats in groups))
+        results, errors = await get_weather_many([city for city, _ in groups], self.locale, PRIORITY_BACKGROUND)
+        # Города, отложенные из-за квоты, получат погоду в следующем цикле рассылки
+        deferred = [city for city, _ in groups if city not in results and city not in errors]
+        if deferred:
+            logger.warning("Рассылка слота %d: %d городов отложено из-за квоты OpenWeatherMap.", slot, len(deferred))
+        await asyncio.gather(*(
+            self._broadcast(context.bot, render_weather(results[city], city, self.locale) if city in results else errors[city], chats)
+            for city, chats in groups if city in results or city in errors
+        ))
+
+    async def _run_alert_slot(self, context):
+        if not self.is_leader:
+            return
+        if backend.shared:
+            await self.restore()
+        slot = context.job.data
+        groups = [(key, group['city'], dict(group['alerts'])) for key, group in self._groups.items() if group['alerts'] and self.slot_for(key) == slot]
+        if not groups:
+            return
+        results, _ = await get_weather_many([city for _, city, _ in groups], self.locale, PRIORITY_BACKGROUND)
+        sends = []
+        for key, city, chats in groups:
+            data = results.get(city)
+            if data is None:
+                continue
+            current = observe(data)
+            by_settings = {}
+            for chat_id, settings in chats.items():
+                by_settings.setdefault(settings_key(settings), (settings, []))[1].append(chat_id)
+            baselines = self._observations.setdefault(key, {})
+            for skey, (settings, chat_ids) in by_settings.items():
+                previous = baselines.get(skey)
+                if previous is None:
+                    baselines[skey] = current
+                    continue
+                changes = detect_changes(previous, current, settings)
+                if changes:
+                    baselines[skey] = current
+                    sends.append(self._broadcast(context.bot, render_alert(data, city, changes, self.locale), chat_ids))
+                else:
+                    baselines[skey] = next_baseline(previous, current)
+        if sends:
+            logger.info("Оповещения слота %d: %d рассылок по %d городам.", slot, len(sends), len(groups))
+            await asyncio.gather(*sends)
+
+    async def _broadcast(self, bot, weather_info, chats):
+        await asyncio.gather(
+            *(send_message_with_retries(bot, chat_id, weather_info, priority=PRIORITY_BROADCAST) for chat_id in chats),
+            return_exceptions=True,
+        )
+
+    async def prewarm(self):
+        cities = [group['city'] for group in self._groups.values()]
+        if cities:
+            results, errors = await get_weather_many(cities, self.locale, PRIORITY_BACKGROUND)
+            logger.info("Прогрев кэша погоды: %d городов загружено, %d ошибок, %d отложено.",
+                        len(results), len(errors), len(cities) - len(results) - len(errors))
+
+    @property
+    def city_count(self):
+        return len(self._groups)
+
+    @property
+    def subscriber_count(self):
+        return len(self._chat_cities)
+
+broadcasts = BroadcastScheduler()
@@ -0,0 +1,27 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    # Объединяет одновременные вызовы с одинаковым ключом в один запрос
+    def __init__(self):
+        self._inflight = {}
+
+    async def do(self, key, func, *args):
+        future = self._inflight.get(key)
+        if future is not None:
+            logger.debug("Ожидание уже выполняющегося запроса для ключа %s.", key)
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(func(*args))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: отмена одного ожидающего не должна отменять общий запрос
+        return await asyncio.shield(future)
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    def __len__(self):
+        return len(self._inflight)
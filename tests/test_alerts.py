@@ -0,0 +1,41 @@
+import alerts
+from alerts import Observation
+
+
+SETTINGS = {'temp': 3, 'pressure': 5, 'precip': True}
+
+
+def test_changes_below_thresholds_ignored():
+    previous = Observation(10.0, 1015, None)
+    assert alerts.detect_changes(previous, Observation(12.5, 1011, None), SETTINGS) == []
+
+
+def test_changes_above_thresholds_reported():
+    previous = Observation(10.0, 1015, None)
+    changes = alerts.detect_changes(previous, Observation(6.0, 1009, 'rain'), SETTINGS)
+    assert changes == [('temp', -4.0), ('rain', None), ('pressure', 6)]
+
+
+def test_disabled_thresholds_and_unchanged_precip():
+    previous = Observation(10.0, 1015, 'snow')
+    settings = {'temp': 0, 'pressure': 5, 'precip': False}
+    assert alerts.detect_changes(previous, Observation(20.0, 1014, 'rain'), settings) == []
+    assert alerts.detect_changes(previous, Observation(10.0, 1015, 'snow'), SETTINGS) == []
+
+
+def test_baseline_accumulates_slow_changes():
+    # Температура и давление меняются понемногу; без оповещения база не сдвигается к ним
+    baseline = Observation(10.0, 1015, None)
+    reported = []
+    for temp, pressure in [(11.0, 1017), (12.0, 1015), (13.5, 1013), (14.0, 1011)]:
+        current = Observation(temp, pressure, None)
+        changes = alerts.detect_changes(baseline, current, SETTINGS)
+        reported.append(changes)
+        baseline = current if changes else alerts.next_baseline(baseline, current)
+    assert reported == [[], [], [('temp', 3.5)], []]
+
+
+def test_baseline_tracks_pressure_maximum():
+    baseline = alerts.next_baseline(Observation(10.0, 1010, None), Observation(10.5, 1016, 'rain'))
+    assert baseline == Observation(10.0, 1016, 'rain')
+    assert alerts.detect_changes(baseline, Observation(10.0, 1011, 'rain'), SETTINGS) == [('pressure', 5)]
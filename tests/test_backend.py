@@ -0,0 +1,44 @@
+import multiprocessing
+
+import backend
+
+
+def acquire(state, barrier, results):
+    barrier.wait()
+    results.put((state.worker_id, state.try_acquire_leadership('broadcasts', ttl=60)))
+
+
+def test_forked_workers_elect_single_leader(tmp_path):
+    # Как в workers.py: backend создан до fork, процессы наследуют один объект
+    state = backend.SQLiteBackend(str(tmp_path / 'state.db'))
+    state.try_acquire_leadership('other', ttl=60)
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(2)
+    results = ctx.Queue()
+    workers = [ctx.Process(target=acquire, args=(state, barrier, results)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    outcome = [results.get(timeout=10) for _ in workers]
+    for worker in workers:
+        worker.join(timeout=10)
+    assert len({worker_id for worker_id, _ in outcome}) == 2
+    assert sorted(leader for _, leader in outcome) == [False, True]
+
+
+def test_lease_renewed_by_owner_and_taken_over_after_expiry(tmp_path, monkeypatch):
+    path = str(tmp_path / 'state.db')
+    first, second = backend.SQLiteBackend(path), backend.SQLiteBackend(path)
+    now = [1000.0]
+    monkeypatch.setattr(backend.time, 'time', lambda: now[0])
+
+    assert first.try_acquire_leadership('broadcasts', ttl=30)
+    assert not second.try_acquire_leadership('broadcasts', ttl=30)
+    now[0] += 20
+    assert first.try_acquire_leadership('broadcasts', ttl=30)
+    now[0] += 20
+    assert not second.try_acquire_leadership('broadcasts', ttl=30)
+    now[0] += 31
+    assert second.try_acquire_leadership('broadcasts', ttl=30)
+    assert not first.try_acquire_leadership('broadcasts', ttl=30)
+    second.release_leadership('broadcasts')
+    assert first.try_acquire_leadership('broadcasts', ttl=30)
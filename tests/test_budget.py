@@ -0,0 +1,73 @@
+import asyncio
+import calendar
+
+import pytest
+
+import backend
+import budget
+from budget import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+# Окна с фиктивным временем должны истекать позже настоящего: LocalBackend сверяет срок с time.time()
+START = calendar.timegm((2031, 12, 31, 23, 58, 0))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(budget, 'backend', backend.LocalBackend())
+    return [float(START)]
+
+
+def make_budget(clock, minute=10, month=0, max_wait=0):
+    return budget.UpstreamBudget('owm', {'minute': minute, 'month': month}, reserve=0.2,
+                                 max_wait=max_wait, timer=lambda: clock[0])
+
+
+def acquire_all(upstream, priorities):
+    async def run():
+        return [await upstream.acquire(priority) for priority in priorities]
+    return asyncio.run(run())
+
+
+def test_window_period_boundaries():
+    assert budget.window_period('minute', START + 59) == (str(START // 60), START + 60)
+    assert budget.window_period('month', START) == ('2031-12', calendar.timegm((2032, 1, 1, 0, 0, 0)))
+    with pytest.raises(ValueError):
+        budget.window_period('day', START)
+
+
+def test_reserve_kept_for_interactive_requests(clock):
+    upstream = make_budget(clock)
+    assert acquire_all(upstream, [PRIORITY_BACKGROUND] * 9) == [True] * 8 + [False]
+    assert acquire_all(upstream, [PRIORITY_INTERACTIVE] * 3) == [True, True, False]
+
+
+def test_minute_window_resets_month_window_accumulates(clock):
+    upstream = make_budget(clock, minute=2, month=5)
+    assert acquire_all(upstream, [PRIORITY_INTERACTIVE] * 3) == [True, True, False]
+    clock[0] += 60
+    assert acquire_all(upstream, [PRIORITY_INTERACTIVE] * 3) == [True, True, False]
+    clock[0] += 60
+    # Новый месяц начался, минутное окно тоже новое
+    assert budget.window_period('month', clock[0])[0] == '2032-01'
+    assert acquire_all(upstream, [PRIORITY_INTERACTIVE] * 2) == [True, True]
+
+
+def test_interactive_waits_for_next_minute(clock, monkeypatch):
+    upstream = make_budget(clock, minute=1, max_wait=60)
+    waits = []
+
+    async def sleep(delay):
+        waits.append(delay)
+        clock[0] += delay
+
+    monkeypatch.setattr(budget.asyncio, 'sleep', sleep)
+    assert acquire_all(upstream, [PRIORITY_INTERACTIVE, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND]) == [True, True, False]
+    assert waits == [60]
+
+
+def test_remaining_reported_after_update(clock):
+    upstream = make_budget(clock, minute=10, month=100)
+    acquire_all(upstream, [PRIORITY_INTERACTIVE] * 3)
+    assert upstream.remaining() == {}
+    asyncio.run(upstream.update_remaining())
+    assert upstream.remaining() == {('owm', 'minute'): 7, ('owm', 'month'): 97}
@@ -0,0 +1,43 @@
+import asyncio
+
+import cache
+
+
+def make_caches(tmp_path, count):
+    path = str(tmp_path / 'cache.db')
+    return [cache.PersistentStaleCache(path, 'weather', 100, ttl=60, timer=lambda: 105) for _ in range(count)]
+
+
+def test_sync_picks_up_entries_flushed_late(tmp_path):
+    a, b, c = make_caches(tmp_path, 3)
+
+    async def run():
+        a.set('x', 1, stored_at=100)
+        b.set('y', 2, stored_at=102)
+        await b.sync()
+        await c.sync()
+        # Запись A старше уже прочитанной C, но попала на диск позже
+        await a.sync()
+        await c.sync()
+
+    asyncio.run(run())
+    assert (c.get('x'), c.get('y')) == (1, 2)
+
+
+def test_sync_keeps_newer_entry_in_memory(tmp_path):
+    a, b = make_caches(tmp_path, 2)
+
+    async def run():
+        a.set('x', 'старое', stored_at=100)
+        await a.sync()
+        b.set('x', 'новое', stored_at=103)
+        await b.sync()
+        await a.sync()
+        b.flush()
+        a.close()
+        reopened = make_caches(tmp_path, 1)[0]
+        await reopened.sync()
+        return reopened
+
+    reopened = asyncio.run(run())
+    assert (a.get('x'), b.get('x'), reopened.get('x')) == ('новое', 'новое', 'новое')
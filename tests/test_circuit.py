@@ -0,0 +1,70 @@
+import circuit
+
+
+def make_breaker(now):
+    return circuit.CircuitBreaker('test', failure_threshold=3, reset_timeout=30,
+                                  min_timeout=1, max_timeout=10, timer=lambda: now[0])
+
+
+def test_opens_after_threshold_and_rejects_until_reset_timeout():
+    now = [0.0]
+    breaker = make_breaker(now)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == circuit.CLOSED
+    breaker.record_failure()
+    assert breaker.state == circuit.OPEN
+    now[0] += 29
+    assert not breaker.allow()
+
+
+def test_success_resets_failure_count():
+    breaker = make_breaker([0.0])
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    assert breaker.state == circuit.CLOSED
+
+
+def test_half_open_allows_single_probe():
+    now = [0.0]
+    breaker = make_breaker(now)
+    for _ in range(3):
+        breaker.record_failure()
+    now[0] += 30
+    assert breaker.allow()
+    assert breaker.state == circuit.HALF_OPEN
+    assert not breaker.allow()
+    # Зависший пробный запрос не блокирует цепь навсегда
+    now[0] += 30
+    assert breaker.allow()
+
+
+def test_probe_result_closes_or_reopens():
+    now = [0.0]
+    breaker = make_breaker(now)
+    for _ in range(3):
+        breaker.record_failure()
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == circuit.OPEN
+    assert not breaker.allow()
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success(0.1)
+    assert breaker.state == circuit.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_timeout_follows_latency_percentile():
+    breaker = make_breaker([0.0])
+    assert breaker.timeout() == 10
+    for _ in range(20):
+        breaker.record_success(0.2)
+    assert breaker.timeout() == 1
+    for _ in range(20):
+        breaker.record_success(2.0)
+    assert breaker.timeout() == 4.0
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import cache
+import currency
+import main
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    snapshots = cache.StaleCache(1, main.CURRENCY_REFRESH_INTERVAL, main.CURRENCY_REFRESH_INTERVAL, timer=lambda: now[0])
+    monkeypatch.setattr(main, 'currency_cache', snapshots)
+    monkeypatch.setattr(currency, 'currency_cache', snapshots)
+    return now
+
+
+@pytest.fixture
+def refreshed(monkeypatch):
+    calls = []
+
+    async def refresh(context=None):
+        calls.append(context)
+
+    monkeypatch.setattr(main, 'refresh_currency_rates', refresh)
+    monkeypatch.setattr(currency, 'refresh_currency_rates', refresh)
+    return calls
+
+
+def run_job(is_leader):
+    context = SimpleNamespace(job=SimpleNamespace(data=SimpleNamespace(is_leader=is_leader)))
+    asyncio.run(main.refresh_currency_job(context))
+
+
+def test_only_leader_refreshes(clock, refreshed):
+    run_job(is_leader=False)
+    assert refreshed == []
+    run_job(is_leader=True)
+    assert len(refreshed) == 1
+
+
+def test_leader_refreshes_before_snapshot_goes_stale(clock, refreshed):
+    main.currency_cache[currency.SNAPSHOT_KEY] = {'timestamp': 0, 'rates': {}}
+    # Снимок, только что загруженный при запуске, повторно не запрашивается
+    run_job(is_leader=True)
+    assert refreshed == []
+    clock[0] += main.CURRENCY_REFRESH_INTERVAL - main.CURRENCY_CHECK_INTERVAL - 1
+    run_job(is_leader=True)
+    assert refreshed == []
+    # До следующей проверки снимок устареет - обновляется сейчас, пока ещё свежий
+    clock[0] += 1
+    assert main.currency_cache.lookup(currency.SNAPSHOT_KEY)[1]
+    run_job(is_leader=True)
+    assert len(refreshed) == 1
+
+
+def test_stale_snapshot_not_refreshed_by_shared_worker(clock, refreshed, monkeypatch):
+    main.currency_cache[currency.SNAPSHOT_KEY] = {'timestamp': 0, 'rates': {}}
+    clock[0] += main.CURRENCY_REFRESH_INTERVAL
+
+    async def lookup():
+        snapshot, fresh = await currency.get_currency_snapshot()
+        await asyncio.sleep(0)
+        return fresh
+
+    monkeypatch.setattr(currency.backend, 'shared', True)
+    assert asyncio.run(lookup()) is False
+    assert refreshed == []
+    monkeypatch.setattr(currency.backend, 'shared', False)
+    assert asyncio.run(lookup()) is False
+    assert len(refreshed) == 1
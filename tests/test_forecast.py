@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+import forecast
+
+DAY = 86400
+
+
+def make_data(items, timezone=0):
+    return {
+        'city': {'id': 1, 'name': 'Киев', 'timezone': timezone},
+        'list': [
+            {'dt': dt, 'main': {'temp': temp}, 'rain': {'3h': rain}, 'pop': pop,
+             'weather': [{'description': description}]}
+            for dt, temp, rain, pop, description in items
+        ],
+    }
+
+
+def test_daily_groups_by_local_day():
+    # Шаг 3 часа от 18:00 UTC; в UTC+3 первый отсчёт приходится на 21:00 первых суток
+    start = 10 * DAY + 18 * 3600
+    items = [(start + i * 10800, float(i), 0.5 * (i % 2), 0.1 * i, f'd{i}') for i in range(10)]
+    days = forecast.HourlySeries(make_data(items, timezone=3 * 3600)).daily(days=5)
+    assert [day[0] for day in days] == [10 * DAY, 11 * DAY, 12 * DAY]
+    assert days[0][1:5] == pytest.approx((0.0, 0.0, 0.0, 0.0))
+    assert days[1][1:5] == pytest.approx((1.0, 8.0, 2.0, 0.8))
+    # Около полудня: 12:00 местного времени = 09:00 UTC, отсчёт №5
+    assert days[1][5] == 'd5'
+    assert days[2][1:5] == pytest.approx((9.0, 9.0, 0.5, 0.9))
+    assert days[2][5] == 'd9'
+
+
+def test_daily_limits_days_and_handles_empty_series():
+    items = [(DAY * (10 + i // 8) + (i % 8) * 10800, 0.0, 0, 0, 'ясно') for i in range(40)]
+    series = forecast.HourlySeries(make_data(items))
+    assert len(series.daily(days=2)) == 2
+    assert [day[0] for day in series.daily(days=2)] == [10 * DAY, 11 * DAY]
+    assert forecast.HourlySeries(make_data([])).daily() == []
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.ext import ApplicationHandlerStop
+
+import inbound
+import message_utils
+
+
+def make_update(update_id, text, user_id=7):
+    return SimpleNamespace(
+        update_id=update_id,
+        effective_user=SimpleNamespace(id=user_id),
+        message=SimpleNamespace(text=text),
+    )
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+
+    async def send(bot, chat_id, text, **kwargs):
+        sent.append((chat_id, text))
+
+    monkeypatch.setattr(message_utils.dispatcher, 'send', send)
+    return sent
+
+
+def test_duplicates_replayed_once_when_processed_sequentially(sent):
+    # Как при CONCURRENT_UPDATES=1: проверка и обработчик всех обновлений в одной задаче
+    guard = inbound.InboundGuard(rate=100, burst=100, dedup_window=10)
+    context = SimpleNamespace(bot=None)
+
+    async def run():
+        for update_id in range(1, 6):
+            update = make_update(update_id, 'Погода')
+            try:
+                await guard.check(update, context)
+            except ApplicationHandlerStop:
+                continue
+            await message_utils.send_message_with_retries(None, 7, 'ответ')
+
+    asyncio.run(run())
+    assert sent == [(7, 'ответ')] * 5
+
+
+def test_redelivered_and_rate_limited_updates_rejected(sent):
+    guard = inbound.InboundGuard(rate=0.001, burst=2, dedup_window=10)
+    context = SimpleNamespace(bot=None)
+
+    async def check(update):
+        try:
+            await guard.check(update, context)
+        except ApplicationHandlerStop:
+            return False
+        return True
+
+    async def run():
+        return [await check(make_update(1, 'Киев')), await check(make_update(1, 'Киев')),
+                await check(make_update(2, 'Львов')), await check(make_update(3, 'Одесса'))]
+
+    assert asyncio.run(run()) == [True, False, True, False]
@@ -1,37 +1,226 @@
 import os
 import json
+import sqlite3
+import asyncio
 import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import USER_DB_FILE, USER_DATA_FLUSH_INTERVAL, USER_DATA_MAX_DIRTY, USER_DATA_IO_WORKERS
+from backend import backend
 
 logger = logging.getLogger(__name__)
 
+# Прежний формат хранения, используется только для переноса данных
 USER_DATA_FILE = 'user_data.json'
 
-# Проверка существования и инициализация пустого файла
-if not os.path.exists(USER_DATA_FILE):
-    with open(USER_DATA_FILE, 'w', encoding='utf-8') as file:
-        json.dump({}, file, indent=4, ensure_ascii=False)
+_conn = None
+_db_lock = threading.Lock()
+_executor = None
+# Профили в памяти: user_id -> профиль (None, если пользователя нет в базе)
+_profiles = {}
+_dirty = set()
+_lock = threading.Lock()
 
-def read_user_data():
-    if os.path.exists(USER_DATA_FILE):
-        if os.stat(USER_DATA_FILE).st_size == 0:  # Проверка на пустоту файла
-            return {}
+def _connect():
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(USER_DB_FILE, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        _migrate_json(conn)
+        _conn = conn
+    return _conn
+
+def _migrate_json(conn):
+    # Однократный перенос пользователей из user_data.json
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+        return
+    data = {}
+    if os.path.exists(USER_DATA_FILE) and os.stat(USER_DATA_FILE).st_size > 0:
         try:
             with open(USER_DATA_FILE, 'r', encoding='utf-8') as file:
-                return json.load(file)
+                data = json.load(file)
         except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"Ошибка чтения файла данных пользователя: {e}")
-    return {}
+            logger.error("Ошибка чтения файла данных пользователя при переносе: %s", e)
+            return
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id, data) VALUES (?, ?)",
+            [(str(user_id), json.dumps(profile, ensure_ascii=False)) for user_id, profile in data.items()],
+        )
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('json_migrated', '1')")
+    if data:
+        logger.info("Перенесено %d пользователей из %s в %s.", len(data), USER_DATA_FILE, USER_DB_FILE)
 
-def save_user_data(user_id, city):
-    data = read_user_data()
-    data[str(user_id)] = {'city': city}
+def read_user_data():
+    try:
+        with _db_lock:
+            rows = _connect().execute("SELECT user_id, data FROM users").fetchall()
+    except sqlite3.Error as e:
+        logger.error("Ошибка чтения базы данных пользователей: %s", e)
+        rows = []
+    data = {user_id: json.loads(profile) for user_id, profile in rows}
+    with _lock:
+        for user_id in _dirty:
+            data[user_id] = dict(_profiles[user_id])
+    return data
 
+def _read_profile(user_id):
     try:
-        with open(USER_DATA_FILE, 'w', encoding='utf-8') as file:
-            json.dump(data, file, indent=4, ensure_ascii=False)
-    except IOError as e:
-        logger.error(f"Ошибка записи в файл данных пользователя: {e}")
+        with _db_lock:
+            row = _connect().execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    except sqlite3.Error as e:
+        logger.error("Ошибка чтения базы данных пользователей: %s", e)
+        raise
+    return json.loads(row[0]) if row else None
+
+def _get_profile(user_id, strict=False):
+    # При общем хранилище профиль могут менять другие процессы, поэтому он не кэшируется.
+    # strict - для изменения профиля: ошибка чтения не должна выдавать пользователя за нового,
+    # иначе запись только новых полей затрёт сохранённый профиль
+    if backend.shared:
+        try:
+            return _read_profile(user_id)
+        except sqlite3.Error:
+            if strict:
+                raise
+            return None
+    with _lock:
+        if user_id in _profiles:
+            return _profiles[user_id]
+    try:
+        profile = _read_profile(user_id)
+    except sqlite3.Error:
+        if strict:
+            raise
+        return None
+    with _lock:
+        # Профиль мог измениться, пока шло чтение с диска
+        return _profiles.setdefault(user_id, profile)
+
+def _update_shared(user_id, fields):
+    # Сквозная запись одной транзакцией для режима с несколькими процессами
+    try:
+        with _db_lock:
+            conn = _connect()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                profile = json.loads(row[0]) if row else {}
+                profile.update(fields)
+                conn.execute(
+                    "INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)",
+                    (user_id, json.dumps(profile, ensure_ascii=False)),
+                )
+    except sqlite3.Error as e:
+        logger.error("Ошибка записи в базу данных пользователей: %s", e)
+        return None
+    return profile
+
+def _apply_update(user_id, fields):
+    _get_profile(user_id, strict=True)
+    with _lock:
+        profile = dict(_profiles.get(user_id) or {})
+        profile.update(fields)
+        _profiles[user_id] = profile
+        _dirty.add(user_id)
+        return dict(profile), len(_dirty) >= USER_DATA_MAX_DIRTY
+
+def update_user_data(user_id, **fields):
+    # Изменения применяются в памяти и записываются на диск пакетом в flush_user_data
+    if backend.shared:
+        return _update_shared(str(user_id), fields)
+    profile, need_flush = _apply_update(str(user_id), fields)
+    if need_flush:
+        flush_user_data()
+    return profile
+
+def save_user_data(user_id, city):
+    update_user_data(user_id, city=city)
 
 def load_user_data(user_id):
-    data = read_user_data()
-    return data.get(str(user_id), None)
+    profile = _get_profile(str(user_id))
+    return dict(profile) if profile is not None else None
+
+def flush_user_data():
+    with _lock:
+        if not _dirty:
+            return 0
+        batch = [(user_id, json.dumps(_profiles[user_id], ensure_ascii=False)) for user_id in _dirty]
+        _dirty.clear()
+    try:
+        with _db_lock:
+            conn = _connect()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany("INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)", batch)
+    except sqlite3.Error as e:
+        logger.error("Ошибка записи в базу данных пользователей: %s", e)
+        with _lock:
+            _dirty.update(user_id for user_id, _ in batch)
+        return 0
+    logger.debug("Записано %d профилей пользователей.", len(batch))
+    return len(batch)
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=USER_DATA_IO_WORKERS, thread_name_prefix='user_data')
+    return _executor
+
+async def _run_in_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args))
+
+def _open_db():
+    with _db_lock:
+        _connect()
+
+async def init_user_data():
+    # Открытие базы и перенос из JSON при запуске, а не при первом обращении пользователя
+    await _run_in_executor(_open_db)
+
+async def load_user_data_async(user_id):
+    user_id = str(user_id)
+    with _lock:
+        if user_id in _profiles and not backend.shared:
+            profile = _profiles[user_id]
+            return dict(profile) if profile is not None else None
+    return await _run_in_executor(load_user_data, user_id)
+
+async def update_user_data_async(user_id, **fields):
+    user_id = str(user_id)
+    if backend.shared:
+        return await _run_in_executor(_update_shared, user_id, fields)
+    with _lock:
+        cached = user_id in _profiles
+    if not cached:
+        await _run_in_executor(_get_profile, user_id, True)
+    profile, need_flush = _apply_update(user_id, fields)
+    if need_flush:
+        asyncio.get_running_loop().run_in_executor(_get_executor(), flush_user_data)
+    return profile
+
+async def save_user_data_async(user_id, city):
+    await update_user_data_async(user_id, city=city)
+
+async def read_user_data_async():
+    return await _run_in_executor(read_user_data)
+
+async def flush_user_data_async():
+    return await _run_in_executor(flush_user_data)
+
+def close_user_data():
+    global _conn, _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    flush_user_data()
+    with _db_lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
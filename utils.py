@@ -1,12 +1,19 @@
 import logging
-from telegram import Update
+from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import CallbackContext
 from message_utils import send_message_with_retries
+from render import message
 
 logger = logging.getLogger(__name__)
 
+def get_locale(context):
+    # Язык профиля, с которым собрано приложение бота
+    return context.bot_data.get('locale', 'ru')
+
 async def request_city(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
-    await send_message_with_retries(context.bot, chat_id, "Пожалуйста, введите название города:")
+    locale = get_locale(context)
+    keyboard = ReplyKeyboardMarkup([[KeyboardButton(message('send_location', locale), request_location=True)]], resize_keyboard=True, one_time_keyboard=True)
+    await send_message_with_retries(context.bot, chat_id, message('ask_city', locale), reply_markup=keyboard)
     context.user_data['waiting_for_city'] = True
@@ -1,106 +1,249 @@
+import time
 import aiohttp
+import asyncio
 import logging
-from telegram import Update, CallbackQuery
-from telegram.ext import CallbackContext
-from cachetools import TTLCache
 from aiohttp import ClientError, ServerTimeoutError
-from message_utils import send_message_with_retries
-from config import WEATHER_API_KEY
-from user_data import save_user_data, load_user_data
+from config import (
+    WEATHER_API_KEY, WEATHER_CACHE_SIZE, WEATHER_CACHE_TTL, WEATHER_CACHE_STALE_TTL, CITY_ALIAS_CACHE_SIZE, CITY_ALIAS_CACHE_TTL, CACHE_DB_PATH,
+    WEATHER_BULK_CONCURRENCY, OWM_API_URL, OWM_CALLS_PER_MINUTE, OWM_CALLS_PER_MONTH,
+)
+from http_client import get_http_session
+from singleflight import SingleFlight
+from cache import make_cache
+from render import render_weather, message
+from circuit import CircuitBreaker
+from budget import UpstreamBudget, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from metrics import cache_requests, upstream_latency, upstream_errors
+from city_index import city_index, snap
 
 logger = logging.getLogger(__name__)
 
-weather_emojis = {
-    "ясно": "☀️",
-    "переменная облачность": "⛅️",
-    "облачно с прояснениями": "🌤",
-    "облачно": "☁️",
-    "пасмурно": "☁️",
-    "дождь": "🌧",
-    "гроза": "⛈",
-    "снег": "❄️",
-    "туман": "🌫"
-}
-
-weather_cache = TTLCache(maxsize=100, ttl=600)
-
-def get_weather_emoji(description):
-    for key in weather_emojis:
-        if key in description:
-            return weather_emojis[key]
-    return ""
-
-async def fetch_weather_data(session, url):
-    async with session.get(url, timeout=10) as response:
-        return await response.json()
-
-async def get_weather(city):
+# Название города (нормализованное) или ячейка сетки координат -> id города в OpenWeatherMap
+city_ids = make_cache('city_ids', CITY_ALIAS_CACHE_SIZE, CITY_ALIAS_CACHE_TTL, path=CACHE_DB_PATH)
+# id города -> необработанный ответ OpenWeatherMap
+weather_cache = make_cache('weather', WEATHER_CACHE_SIZE, WEATHER_CACHE_TTL, WEATHER_CACHE_STALE_TTL, path=CACHE_DB_PATH)
+weather_requests = SingleFlight()
+# Максимум id городов в одном запросе group к OpenWeatherMap
+OWM_GROUP_SIZE = 20
+owm_circuit = CircuitBreaker('openweathermap')
+owm_budget = UpstreamBudget('openweathermap', {'minute': OWM_CALLS_PER_MINUTE, 'month': OWM_CALLS_PER_MONTH})
+_background_tasks = set()
+
+class WeatherError(Exception):
+    # key - ключ текста ошибки в render.MESSAGES
+    def __init__(self, key):
+        super().__init__(message(key))
+        self.key = key
+
+    def text(self, locale='ru'):
+        return message(self.key, locale)
+
+def normalize_city(city):
+    return ' '.join(city.split()).casefold()
+
+def location_query(lat, lon):
+    # Ключ кэша и параметры запроса для ячейки сетки с этими координатами
+    lat, lon = snap(lat, lon)
+    return f"@{lat},{lon}", {'lat': lat, 'lon': lon}
+
+def resolve_city(city):
+    # Возвращает (ключ кэша, параметры запроса, название для ответа).
+    # Город из локального индекса запрашивается по id или координатам без текстового поиска.
+    found = city_index.match(city)
+    if found is None:
+        key = normalize_city(city)
+        return key, {'q': key}, city
+    entry, name = found
+    key, params = location_query(entry.lat, entry.lon)
+    if entry.id is not None:
+        params = {'id': entry.id}
+    return key, params, name
+
+def city_not_found_text(city, locale='ru'):
+    # Похожий город из индекса предлагается, но не подставляется вместо введённого
+    found = city_index.suggest(city)
+    if found is None:
+        return message('city_not_found', locale)
+    return message('city_suggestion', locale, city=found[1])
+
+async def get_weather(city, locale='ru'):
     if not city:
         logger.warning("Название города не может быть пустым.")
-        return "Название города не может быть пустым."
+        return message('empty_city', locale)
+
+    key, params, name = resolve_city(city)
+    try:
+        data = await load_weather(key, params)
+    except WeatherError as e:
+        if e.key == 'city_not_found':
+            return city_not_found_text(city, locale)
+        return e.text(locale)
+    return render_weather(data, name, locale)
+
+async def get_weather_by_location(lat, lon, locale='ru'):
+    # Возвращает (название города или None, текст ответа)
+    entry = city_index.nearest(lat, lon)
+    if entry is not None:
+        key, params = location_query(entry.lat, entry.lon)
+    else:
+        key, params = location_query(lat, lon)
+    try:
+        data = await load_weather(key, params)
+    except WeatherError as e:
+        return None, e.text(locale)
+    name = entry.name if entry is not None else data.get('name')
+    if name and entry is None and data['id']:
+        # Название от OpenWeatherMap: при вводе текстом оно попадёт в ту же запись кэша
+        city_ids[normalize_city(name)] = data['id']
+    return name, render_weather(data, name or f"{lat:.2f}, {lon:.2f}", locale)
+
+async def load_weather(key, params=None, priority=PRIORITY_INTERACTIVE):
+    if params is None:
+        params = {'q': key}
+    city_id = city_ids.get(key)
+    if city_id is not None:
+        data, fresh = weather_cache.lookup(city_id)
+        if data is not None:
+            cache_requests.inc('weather', 'hit' if fresh else 'stale')
+            if fresh:
+                logger.debug("Погода для города %s взята из кэша.", key)
+            else:
+                logger.debug("Погода для города %s устарела, отдаём из кэша и обновляем в фоне.", key)
+                refresh_weather(city_id)
+            return data
+    cache_requests.inc('weather', 'miss')
+    if city_id is not None:
+        return await weather_requests.do(('id', city_id), request_weather, {'id': city_id}, None, priority)
+    return await weather_requests.do(('q', key), request_weather, params, key, priority)
 
-    if city in weather_cache:
-        logger.info(f"Погода для города {city} взята из кэша.")
-        return weather_cache[city]
+def refresh_weather(city_id):
+    if ('id', city_id) in weather_requests:
+        return
+    task = asyncio.ensure_future(weather_requests.do(('id', city_id), request_weather, {'id': city_id}, None, PRIORITY_BACKGROUND))
+    _background_tasks.add(task)
+    task.add_done_callback(_on_refresh_done)
 
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={WEATHER_API_KEY}&units=metric&lang=ru"
-    logger.info(f"Отправка запроса на URL: {url}")
+def _on_refresh_done(task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Ошибка фонового обновления погоды: %s", task.exception())
 
+async def request_owm(endpoint, params, priority=PRIORITY_INTERACTIVE):
+    if not owm_circuit.allow():
+        logger.warning("Запрос к OpenWeatherMap пропущен: цепь разомкнута.")
+        raise WeatherError('weather_unavailable')
+    if not await owm_budget.acquire(priority):
+        raise WeatherError('weather_quota')
+
+    url = f"{OWM_API_URL}/{endpoint}"
+    query = dict(params, appid=WEATHER_API_KEY, units='metric', lang='ru')
+    logger.debug("Отправка запроса погоды (%s): %s", endpoint, params)
+
+    started = time.monotonic()
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as response:
-                logger.info(f"Получен ответ с кодом состояния: {response.status}")
-                if response.status == 200:
-                    data = await response.json()
-                    logger.info(f"Получены данные: {data}")
-                    weather = data['weather'][0]['description']
-                    temp = data['main']['temp']
-                    feels_like = data['main']['feels_like']
-                    humidity = data['main']['humidity']
-                    pressure = data['main']['pressure']
-                    weather_emoji = get_weather_emoji(weather)
-
-                    weather_info = (
-                        f"Погода в {city}:\n"
-                        f"Описание: {weather} {weather_emoji}\n"
-                        f"Температура: {temp}°C 🌡️\n"
-                        f"Ощущается как: {feels_like}°C 🌡️\n"
-                        f"Влажность: {humidity}% 💧\n"
-                        f"Давление: {pressure} hPa 🌬️\n"
-                        f"😃"
-                    )
-                    weather_cache[city] = weather_info
-                    return weather_info
-                elif response.status == 404:
-                    logger.warning("Город не найден. Проверьте правильность ввода.")
-                    return "Город не найден. Проверьте правильность ввода."
-                else:
-                    logger.error("Не удалось получить данные о погоде.")
-                    return "Не удалось получить данные о погоде."
+        session = await get_http_session()
+        timeout = aiohttp.ClientTimeout(total=owm_circuit.timeout())
+        async with session.get(url, params=query, timeout=timeout) as response:
+            logger.debug("Получен ответ с кодом состояния: %s", response.status)
+            upstream_latency.observe(time.monotonic() - started, 'openweathermap')
+            if response.status == 200:
+                data = await response.json()
+                owm_circuit.record_success(time.monotonic() - started)
+                return data
+            elif response.status == 404:
+                owm_circuit.record_success(time.monotonic() - started)
+                logger.warning("Город не найден. Проверьте правильность ввода.")
+                raise WeatherError('city_not_found')
+            else:
+                owm_circuit.record_failure()
+                upstream_errors.inc('openweathermap')
+                logger.error("Не удалось получить данные о погоде.")
+                raise WeatherError('weather_failed')
     except (asyncio.TimeoutError, ClientError, ServerTimeoutError, aiohttp.ClientConnectorError, aiohttp.ContentTypeError) as e:
-        logger.error(f"Ошибка при получении данных о погоде: {e}")
-        return "Произошла ошибка при получении данных о погоде. Попробуйте снова позже."
-
-async def get_weather_update(update: Update, context: CallbackContext):
-    if isinstance(update, CallbackQuery):
-        query = update
-        user_id = query.from_user.id
-        chat_id = query.message.chat_id
-        city = context.user_data.get('city', 'Неизвестно')
-    else:
-        user_data = load_user_data(update.effective_user.id)
-        city = user_data.get('city') if user_data else None
+        owm_circuit.record_failure()
+        upstream_errors.inc('openweathermap')
+        logger.error("Ошибка при получении данных о погоде: %s", e)
+        raise WeatherError('weather_error')
+
+async def request_weather(params, key=None, priority=PRIORITY_INTERACTIVE):
+    data = await request_owm('weather', params, priority)
+    logger.debug("Получены данные: %s", data)
+    city_id = data['id']
+    if not city_id:
+        # Для координат вне городов OpenWeatherMap возвращает id 0, такие ответы не кэшируются
+        return data
+    weather_cache[city_id] = data
+    if key is not None:
+        city_ids[key] = city_id
+    return data
+
+async def request_weather_group(city_ids_batch, priority=PRIORITY_INTERACTIVE):
+    # Один запрос OpenWeatherMap на группу известных id городов
+    data = await request_owm('group', {'id': ','.join(str(city_id) for city_id in city_ids_batch)}, priority)
+    results = {}
+    for item in data.get('list', []):
+        weather_cache[item['id']] = item
+        results[item['id']] = item
+    return results
 
-        if city:
-            weather_info = await get_weather(city)
-            await send_message_with_retries(context.bot, update.effective_chat.id, weather_info)
+async def get_weather_many(cities, locale='ru', priority=PRIORITY_INTERACTIVE):
+    # Возвращает ({город: данные OpenWeatherMap}, {город: текст ошибки на языке locale}).
+    # Города без данных, запрос которых отложен из-за квоты, не попадают ни в один из словарей
+    results, errors = {}, {}
+    stale_ids = {}  # id города -> города из запроса с этим id
+    lookups = []  # (город, ключ, параметры) для городов, id которых ещё неизвестен
+    for city in dict.fromkeys(cities):
+        if not city:
+            errors[city] = message('empty_city', locale)
+            continue
+        key, params, _ = resolve_city(city)
+        city_id = city_ids.get(key)
+        if city_id is None:
+            lookups.append((city, key, params))
+            continue
+        data, fresh = weather_cache.lookup(city_id)
+        if fresh:
+            cache_requests.inc('weather', 'hit')
+            results[city] = data
+        else:
+            cache_requests.inc('weather', 'stale' if data is not None else 'miss')
+            stale_ids.setdefault(city_id, []).append(city)
+
+    semaphore = asyncio.Semaphore(WEATHER_BULK_CONCURRENCY)
+
+    async def limited(func, *args):
+        async with semaphore:
+            return await func(*args)
+
+    ids = list(stale_ids)
+    batches = [ids[i:i + OWM_GROUP_SIZE] for i in range(0, len(ids), OWM_GROUP_SIZE)]
+    outcomes = await asyncio.gather(
+        *(limited(request_weather_group, batch, priority) for batch in batches),
+        *(limited(load_weather, key, params, priority) for _, key, params in lookups),
+        return_exceptions=True,
+    )
+
+    for batch, outcome in zip(batches, outcomes):
+        for city_id in batch:
+            # Если группа не обновилась, используем устаревшие данные из кэша
+            data = outcome.get(city_id) if isinstance(outcome, dict) else None
+            if data is None:
+                data = weather_cache.get(city_id)
+            for city in stale_ids[city_id]:
+                if data is not None:
+                    results[city] = data
+                elif isinstance(outcome, WeatherError) and outcome.key == 'weather_quota':
+                    continue
+                else:
+                    errors[city] = outcome.text(locale) if isinstance(outcome, WeatherError) else message('weather_failed', locale)
+    for (city, _, _), outcome in zip(lookups, outcomes[len(batches):]):
+        if isinstance(outcome, WeatherError) and outcome.key == 'weather_quota':
+            continue
+        if isinstance(outcome, WeatherError):
+            errors[city] = outcome.text(locale)
+        elif isinstance(outcome, Exception):
+            logger.error("Ошибка при получении погоды для %s: %s", city, outcome)
+            errors[city] = message('weather_error', locale)
         else:
-            await request_city(update, context)
-
-async def send_weather_update(context: CallbackContext):
-    job = context.job
-    city = job.data['city']
-    chat_id = job.data['chat_id']
-    weather_info = await get_weather(city)
-    bot = context.bot
-    await send_message_with_retries(bot, chat_id, weather_info)
+            results[city] = outcome
+    return results, errors
@@ -0,0 +1,91 @@
+import hmac
+import signal
+import asyncio
+import logging
+import secrets
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+def make_webhook_app(routes, secret_token):
+    # routes: путь -> приложение бота; несколько ботов принимают обновления на одном сервере
+    def make_handler(application):
+        async def handle_update(request):
+            if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), secret_token):
+                logger.warning("Отклонён запрос webhook с неверным секретным токеном от %s.", request.remote)
+                return web.Response(status=403)
+            try:
+                data = await request.json()
+            except ValueError:
+                return web.Response(status=400)
+            update = Update.de_json(data, application.bot)
+            # Обновление обрабатывается теми же обработчиками, что и при опросе
+            await application.update_queue.put(update)
+            return web.Response()
+        return handle_update
+
+    app = web.Application()
+    for path, application in routes.items():
+        app.router.add_post(f"/{path}", make_handler(application))
+    return app
+
+def webhook_routes(applications, path):
+    # Основной бот слушает path, остальные - path-<имя бота>
+    path = path.strip('/')
+    return {
+        f"{path}-{application.bot_data['name']}" if application.bot_data.get('name') else path: application
+        for application in applications
+    }
+
+async def _serve(applications, webhook_url, listen, port, path, secret_token, reuse_port):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    routes = webhook_routes(applications, path)
+    runner = web.AppRunner(make_webhook_app(routes, secret_token))
+    started = []
+    try:
+        for route, application in routes.items():
+            await application.initialize()
+            started.append(application)
+            if application.post_init:
+                await application.post_init(application)
+        await runner.setup()
+        await web.TCPSite(runner, listen, port, reuse_port=reuse_port).start()
+        for route, application in routes.items():
+            await application.bot.set_webhook(
+                url=f"{webhook_url.rstrip('/')}/{route}",
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            await application.start()
+            logger.info("Webhook-сервер запущен на %s:%s/%s", listen, port, route)
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        for application in reversed(started):
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+def run_webhook(applications, webhook_url, listen='127.0.0.1', port=8080, path='telegram', secret_token=None, reuse_port=False):
+    if not webhook_url:
+        raise ValueError("WEBHOOK_URL не задан. Укажите публичный адрес для режима webhook.")
+    if not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+        logger.info("WEBHOOK_SECRET не задан, сгенерирован случайный секретный токен.")
+    if not isinstance(applications, (list, tuple)):
+        applications = [applications]
+    asyncio.run(_serve(applications, webhook_url, listen, port, path, secret_token, reuse_port))
@@ -0,0 +1,60 @@
+import os
+import signal
+import secrets
+import importlib
+import logging
+import multiprocessing
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+def run_worker(index):
+    import main
+    main.main(index)
+
+def main():
+    # Значения из .env имеют приоритет над умолчаниями для нескольких процессов ниже,
+    # поэтому файл загружается до них (config загрузит его ещё раз без изменений)
+    env_file = os.getenv('ENV_FILE', '.env')
+    if os.path.isfile(env_file):
+        from dotenv import load_dotenv
+        load_dotenv(env_file)
+    # Все процессы принимают webhook на одном порту и делят состояние через SQLite
+    os.environ.setdefault('STATE_BACKEND', 'sqlite')
+    os.environ.setdefault('BOT_MODE', 'webhook')
+    os.environ.setdefault('WEBHOOK_REUSE_PORT', '1')
+    os.environ.setdefault('CACHE_DB_PATH', 'cache.db')
+    # Секретный токен должен совпадать у всех процессов
+    os.environ.setdefault('WEBHOOK_SECRET', secrets.token_urlsafe(32))
+    if os.environ['BOT_MODE'] != 'webhook':
+        raise ValueError("Несколько процессов поддерживаются только в режиме webhook.")
+
+    # Модули бота импортируются до запуска процессов: при fork дочерние процессы
+    # и их перезапуски получают их готовыми. Импорт не открывает соединений и файлов.
+    importlib.import_module("main")
+    from config import WORKERS
+
+    processes = [multiprocessing.Process(target=run_worker, args=(i,), name=f"worker-{i}") for i in range(WORKERS)]
+    for process in processes:
+        process.start()
+    logger.info("Запущено процессов: %d", len(processes))
+
+    def terminate(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        terminate(None, None)
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()